@@ -1,10 +1,7 @@
-from wagtail.api.v2.router import WagtailAPIRouter
-from wagtail.images.api.v2.views import ImagesAPIViewSet
-from wagtail.documents.api.v2.views import DocumentsAPIViewSet
+from core.async_views import AsyncWagtailAPIRouter
+from core.views import DocumentsAPIViewSet, ImagesAPIViewSet, PagesAPIViewSet
 
-from core.views import PagesAPIViewSet
-
-api_router = WagtailAPIRouter("wagtailapi")
+api_router = AsyncWagtailAPIRouter("wagtailapi")
 api_router.register_endpoint("pages", PagesAPIViewSet)
 api_router.register_endpoint("images", ImagesAPIViewSet)
 api_router.register_endpoint("documents", DocumentsAPIViewSet)
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.replicas.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
@@ -89,6 +90,52 @@ DATABASES = {
         "PORT": int(config["DB_PORT"]),
     }
 }
+
+# Read replicas of the default database, as a comma separated list of hosts.
+# The anonymous reads of the API and search go to them, see core.replicas
+DATABASE_REPLICAS = []
+for index, host in enumerate(filter(None, config.get("DB_REPLICA_HOSTS", "").split(","))):
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+REPLICA_READ_PATHS = ["/api/", "/search/"]
+# Seconds that every read stays on the primary after a write, while the
+# replicas catch up
+REPLICA_LAG_SECONDS = int(config.get("REPLICA_LAG_SECONDS") or 5)
+
+# The cache must be shared by every process that serves the site or runs jobs
+# (see core.cache): invalidating the cached restrictions, sites, routes,
+# responses, snapshots and search index only reaches the processes that share
+# it. Memcached (django.core.cache.backends.memcached.PyMemcacheCache),
+# selected with CACHE_BACKEND and CACHE_LOCATION, is the supported backend in
+# production. The default is the database table created by
+# "manage.py createcachetable", where every cache read is a query on the
+# primary (e.g. the replica check of every anonymous API request).
+CACHES = {
+    "default": {
+        "BACKEND": config.get(
+            "CACHE_BACKEND", "django.core.cache.backends.db.DatabaseCache"
+        ),
+        "LOCATION": config.get("CACHE_LOCATION", "core_cache"),
+    }
+}
+if CACHES["default"]["BACKEND"].endswith(".DatabaseCache"):
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": 10000}
+# Seconds that generation tokens, and the entries keyed by them, are kept.
+# Every process rebuilds its cached copies at least this often.
+CACHE_GENERATION_TIMEOUT = int(config.get("CACHE_GENERATION_TIMEOUT") or 3600)
+# Seconds that each process reuses a generation token before reading it from
+# the cache again, so invalidations reach the other processes that much later
+CACHE_GENERATION_CHECK_INTERVAL = float(
+    config.get("CACHE_GENERATION_CHECK_INTERVAL") or 1
+)
+
 SILENCED_SYSTEM_CHECKS = ["models.W027"]
 SILENCED_SYSTEM_CHECKS = ["models.W036"]
 
@@ -138,7 +185,7 @@ else:
 
 REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": [
-        "djangorestframework_camel_case.render.CamelCaseJSONRenderer",
+        "core.renderers.CamelCaseJSONRenderer",
         "djangorestframework_camel_case.render.CamelCaseBrowsableAPIRenderer",
     ],
     "DEFAULT_PARSER_CLASSES": (
@@ -181,14 +228,23 @@ MEDIA_URL = "/media/"
 # https://docs.wagtail.org/en/stable/topics/search/backends.html
 WAGTAILSEARCH_BACKENDS = {
     "default": {
-        "BACKEND": "wagtail.search.backends.database",
+        "BACKEND": "search.backends",
+        "FALLBACK": "wagtail.search.backends.database",
     }
 }
+# File of the in-memory search index of the live pages, see search.backends.
+# The web and job worker processes of a host should share its directory.
+SEARCH_INDEX_PATH = config.get("SEARCH_INDEX_PATH") or os.path.join(
+    PROJECT_DIR, "search_index", "index"
+)
 
 USE_X_FORWARDED_HOST = True
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 
+# Messages are saved to an outbox and sent by a background job, in batches
+# of EMAIL_BATCH_SIZE over one SMTP connection per worker
 EMAIL_BACKEND = "core.smtp.EmailBackend"
+EMAIL_BATCH_SIZE = 50
 
 FRONTEND_URL = config.get("FRONTEND_URL")
 
@@ -201,4 +257,36 @@ WAGTAILADMIN_BASE_URL = config.get("ADMIN_BASE_URL", "http://example.com")
 WAGTAIL_ENABLE_UPDATE_CHECK = False
 DEFAULT_FROM_EMAIL = "CMS Backend <cms@backend.com>"
 WAGTAILAPI_LIMIT_DEFAULT = 100
-WAGTAILAPI_LIMIT_MAX = None
\ No newline at end of file
+WAGTAILAPI_LIMIT_MAX = None
+# Default for the pages API "count" parameter: exact, cached, estimate or none
+WAGTAILAPI_COUNT_MODE = config.get("WAGTAILAPI_COUNT_MODE", "exact")
+
+# Pages API response cache timeout, in seconds. Cached responses are dropped
+# whenever pages are published, unpublished, moved or deleted.
+API_RESPONSE_CACHE_TIMEOUT = int(config.get("API_RESPONSE_CACHE_TIMEOUT") or 0) or None
+
+# Size of the thread pool that runs the database and cache work of the API
+# views. When set, the API views are async, for serving under ASGI (e.g.
+# gunicorn with uvicorn workers on cms-backend.asgi), and listings are never
+# streamed, as Django 3.2 can't stream responses from async views
+API_ASYNC_THREADS = int(config.get("API_ASYNC_THREADS") or 0) or None
+
+# Image renditions generated by a background job when images are uploaded, and
+# listed in the API: one per width and format ("original" keeps the format of
+# the uploaded file)
+API_IMAGE_RENDITION_WIDTHS = [480, 960, 1440, 2880]
+API_IMAGE_RENDITION_FORMATS = ["webp", "original"]
+
+# Background jobs (see core.jobs), run by the run_jobs command. Failed jobs
+# are retried after JOBS_RETRY_DELAY seconds, doubled on every attempt, and
+# running jobs are claimed again after JOBS_LOCK_TIMEOUT seconds
+JOBS_CONCURRENCY = int(config.get("JOBS_CONCURRENCY") or 2)
+JOBS_POLL_INTERVAL = 1
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 10
+JOBS_LOCK_TIMEOUT = 600
+
+# Search hits are saved in batches, every this many seconds or once this many
+# different queries are pending
+SEARCH_HITS_FLUSH_INTERVAL = int(config.get("SEARCH_HITS_FLUSH_INTERVAL") or 10)
+SEARCH_HITS_MAX_PENDING = 1000
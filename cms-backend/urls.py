@@ -17,6 +17,9 @@ urlpatterns = [
     path("admin/", include(wagtailadmin_urls)),
     path("documents/", include(wagtaildocs_urls)),
     path("search/", search_views.search, name="search"),
+    path(
+        "search/suggestions/", search_views.suggestions, name="search_suggestions"
+    ),
     path("api/", api_router.urls),
     path("", include("core.urls")),
 ]
@@ -0,0 +1,109 @@
+import hashlib
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from wagtail.documents import get_document_model
+from wagtail.images import get_image_model
+from wagtail.models import Page
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from core.cache import Generation
+from core.renditions import renditions_generated
+
+
+# Changes whenever the live content served by the pages API changes
+page_content = Generation("page_content")
+
+# Query parameters that don't change the response
+IGNORED_QUERY_PARAMETERS = {"_"}
+
+
+def normalize_query(query_dict):
+    """
+    Returns the query parameters as a sorted tuple, so equivalent query
+    strings map to the same cache key.
+    """
+    return tuple(
+        sorted(
+            (key, tuple(sorted(values)))
+            for key, values in query_dict.lists()
+            if key not in IGNORED_QUERY_PARAMETERS
+        )
+    )
+
+
+def get_response_cache_key(request, site, restricted_paths):
+    """
+    Returns the cache key of an API response for this request.
+
+    Requests only share a key when they ask for the same path, query and
+    format on the same site, and are denied the same restricted pages.
+    """
+    fingerprint = repr(
+        (
+            request.path,
+            normalize_query(request.GET),
+            request.accepted_renderer.format,
+            site.id if site else None,
+            restricted_paths,
+        )
+    )
+    return "core:api:stored_response:%s:%s" % (
+        page_content.get(),
+        hashlib.sha1(fingerprint.encode()).hexdigest(),
+    )
+
+
+def get_last_modified(timestamps):
+    """
+    Returns the latest of the given timestamps, ignoring missing ones.
+    """
+    return max((timestamp for timestamp in timestamps if timestamp), default=None)
+
+
+def get_etag(request, site, restricted_paths, last_modified, discriminator):
+    """
+    Returns a strong ETag for an API response.
+
+    Besides the request itself, the tag covers the negotiated format, the
+    latest modification time of the pages in the response and the
+    discriminator (e.g. the number of pages in a listing, so removals change
+    it too).
+    """
+    fingerprint = repr(
+        (
+            request.path,
+            normalize_query(request.GET),
+            request.accepted_renderer.format,
+            site.id if site else None,
+            restricted_paths,
+            page_content.get(),
+            last_modified.isoformat() if last_modified else None,
+            discriminator,
+        )
+    )
+    return '"%s"' % hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+def invalidate_page_content(sender, **kwargs):
+    page_content.invalidate()
+
+
+@receiver(post_delete)
+def invalidate_page_content_on_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page):
+        page_content.invalidate()
+
+
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+@receiver(post_save, sender=get_document_model())
+@receiver(post_delete, sender=get_document_model())
+@receiver(renditions_generated)
+def invalidate_page_content_on_media_change(sender, **kwargs):
+    # Pages embed image and document titles and URLs
+    page_content.invalidate()
@@ -4,3 +4,19 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Connect the cache and snapshot invalidation receivers, the replica
+        # stickiness one and the ones that queue background jobs, and register
+        # the jobs
+        from core import (  # noqa: F401
+            api_cache,
+            bundles,
+            replicas,
+            restrictions,
+            routes,
+            sites,
+            smtp,
+            snapshots,
+            tasks,
+        )
@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from wagtail.api.v2.router import WagtailAPIRouter
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the thread pool that the async API views run their database and
+    cache work in. Its size bounds the database connections of the process.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.API_ASYNC_THREADS,
+                    thread_name_prefix="api",
+                )
+    return _executor
+
+
+async def run_in_executor(func, *args, **kwargs):
+    """
+    Runs a synchronous function in the API thread pool and awaits its result.
+    """
+
+    def run():
+        # Like a request would, drop the connections that are broken or older
+        # than CONN_MAX_AGE before and after using them
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    # Run in a copy of the current context, which carries per-request state
+    # such as whether the reads may go to a replica
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), context.run, run)
+
+
+def async_read_only_view(view):
+    """
+    Turns a synchronous read-only view into an async one that runs it, and
+    renders its response, in the API thread pool.
+
+    Under ASGI, Django runs synchronous views one at a time in a single
+    thread, so a slow query holds every other request back. Async views
+    share the event loop instead, which only waits on the pool.
+
+    The view must not return a streaming response: Django 3.2 iterates them
+    in the event loop, where the database can't be used.
+
+    The synchronous view stays available as ``sync_view``.
+    """
+
+    def respond(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if hasattr(response, "render") and callable(response.render):
+            response = response.render()
+        return response
+
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await run_in_executor(respond, request, *args, **kwargs)
+
+    async_view.sync_view = view
+    return async_view
+
+
+class AsyncAPIViewSetMixin:
+    """
+    Serves the endpoint from async views when API_ASYNC_THREADS is set.
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        if getattr(settings, "API_ASYNC_THREADS", None):
+            view = async_read_only_view(view)
+        return view
+
+
+class AsyncWagtailAPIRouter(WagtailAPIRouter):
+    """
+    A WagtailAPIRouter that keeps async endpoint views async.
+    """
+
+    def wrap_view(self, func):
+        if not asyncio.iscoroutinefunction(func):
+            return super().wrap_view(func)
+
+        @functools.wraps(func)
+        async def wrapped(request, *args, **kwargs):
+            request.wagtailapi_router = self
+            return await func(request, *args, **kwargs)
+
+        wrapped.sync_view = super().wrap_view(func.sync_view)
+        return wrapped
@@ -1,11 +1,111 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
 from django.conf import settings
 from wagtail import blocks
 from wagtail.documents.blocks import DocumentChooserBlock as DefaultDocumentChooserBlock
+from wagtail.fields import StreamField
+from wagtail.images import get_image_model
 from wagtail.images.blocks import ImageChooserBlock as DefaultImageChooserBlock
 from wagtail.core.models import Site
 
-
-class ImageChooserBlock(DefaultImageChooserBlock):
+from core.renditions import get_image_renditions, get_rendition_specs
+
+
+# Chooser block objects loaded ahead of serialization, by model and primary key
+prefetched_chooser_objects = ContextVar("prefetched_chooser_objects", default=None)
+
+
+def collect_chooser_ids(block, value, ids):
+    """
+    Walks the raw (JSON) value of a block and adds the primary keys referenced
+    by its chooser blocks that use prefetched objects to ``ids``, grouped by
+    model.
+    """
+    if value is None:
+        return
+
+    if isinstance(block, PrefetchedChooserBlockMixin):
+        ids[block.model_class].add(value)
+
+    elif isinstance(block, blocks.StreamBlock):
+        for child in value:
+            child_block = block.child_blocks.get(child.get("type"))
+            if child_block is not None:
+                collect_chooser_ids(child_block, child.get("value"), ids)
+
+    elif isinstance(block, blocks.StructBlock):
+        for name, child_block in block.child_blocks.items():
+            collect_chooser_ids(child_block, value.get(name), ids)
+
+    elif isinstance(block, blocks.ListBlock):
+        for child in value:
+            # List items are stored as {"type": "item", "value": ...} since Wagtail 2.16
+            if isinstance(child, dict) and child.get("type") == "item":
+                child = child.get("value")
+            collect_chooser_ids(block.child_block, child, ids)
+
+
+@contextmanager
+def prefetch_chooser_blocks(instances, field_names):
+    """
+    Loads the objects referenced by chooser blocks in the given StreamFields
+    (those that will be serialized) of all the given instances, with one query
+    per model, and makes the chooser blocks below use them while the context
+    is active.
+    """
+    ids = defaultdict(set)
+    for instance in instances:
+        for field in instance._meta.get_fields():
+            if field.name in field_names and isinstance(field, StreamField):
+                value = getattr(instance, field.name)
+                if value:
+                    collect_chooser_ids(field.stream_block, value.raw_data, ids)
+
+    prefetched = {}
+    for model, pks in ids.items():
+        queryset = model.objects.all()
+        if issubclass(model, get_image_model()):
+            queryset = queryset.prefetch_renditions(*get_rendition_specs())
+        objects = queryset.in_bulk(pks)
+        # Remember missing objects too, so they aren't looked up again
+        prefetched[model] = {pk: objects.get(pk) for pk in pks}
+
+    token = prefetched_chooser_objects.set(prefetched)
+    try:
+        yield
+    finally:
+        prefetched_chooser_objects.reset(token)
+
+
+class PrefetchedChooserBlockMixin:
+    """
+    Resolves chooser values from the objects loaded by prefetch_chooser_blocks,
+    falling back to a query for anything that wasn't prefetched.
+    """
+
+    def get_prefetched_objects(self):
+        prefetched = prefetched_chooser_objects.get()
+        if prefetched is not None:
+            return prefetched.get(self.model_class)
+
+    def to_python(self, value):
+        objects = self.get_prefetched_objects()
+        if objects is not None and value in objects:
+            return objects[value]
+        return super().to_python(value)
+
+    def bulk_to_python(self, values):
+        objects = self.get_prefetched_objects()
+        if objects is None or any(
+            value is not None and value not in objects for value in values
+        ):
+            return super().bulk_to_python(values)
+        return [objects.get(value) for value in values]
+
+
+class ImageChooserBlock(PrefetchedChooserBlockMixin, DefaultImageChooserBlock):
     def get_api_representation(self, value, context=None):
         if value:
             return {
@@ -13,11 +113,12 @@ class ImageChooserBlock(DefaultImageChooserBlock):
                 "title": value.title,
                 "detail_url": f"{settings.WAGTAILADMIN_BASE_URL}/api/images/{value.id}/",
                 "download_url": f"{settings.WAGTAILADMIN_BASE_URL}{value.file.url}",
+                **get_image_renditions(value),
             }
         return super().get_api_representation(value, context)
 
 
-class DocumentChooserBlock(DefaultDocumentChooserBlock):
+class DocumentChooserBlock(PrefetchedChooserBlockMixin, DefaultDocumentChooserBlock):
     def get_api_representation(self, value, context=None):
         if value:
             return {
@@ -0,0 +1,75 @@
+import hashlib
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from wagtail.documents import get_document_model
+from wagtail.images import get_image_model
+from wagtail.models import Page
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from core.cache import Generation
+from core.models import FooterPage, HomePage, InformationPage
+from core.renditions import renditions_generated
+
+
+# Changes whenever one of the pages in the site bundle may have changed
+site_bundle = Generation("site_bundle")
+
+# The singleton pages in the site bundle, by their key in the document
+SITE_BUNDLE_MODELS = [
+    ("home", HomePage),
+    ("information", InformationPage),
+    ("footer", FooterPage),
+]
+
+
+def get_site_bundle_cache_key(request, site, restricted_paths):
+    """
+    Returns the cache key of the rendered site bundle for this request.
+
+    The bundle contains absolute URLs, so the key covers the scheme and host
+    the request was made on, besides the site and the restricted pages.
+    """
+    fingerprint = repr(
+        (
+            request.scheme,
+            request.get_host(),
+            request.accepted_renderer.format,
+            site.id if site else None,
+            restricted_paths,
+        )
+    )
+    return "core:api:stored_site_bundle:%s:%s" % (
+        site_bundle.get(),
+        hashlib.sha1(fingerprint.encode()).hexdigest(),
+    )
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+def invalidate_site_bundle_on_publish(sender, instance, **kwargs):
+    if isinstance(instance, tuple(model for key, model in SITE_BUNDLE_MODELS)):
+        site_bundle.invalidate()
+
+
+@receiver(post_page_move)
+def invalidate_site_bundle_on_move(sender, **kwargs):
+    # Moves change the URLs and parents in the bundle
+    site_bundle.invalidate()
+
+
+@receiver(post_delete)
+def invalidate_site_bundle_on_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page):
+        site_bundle.invalidate()
+
+
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+@receiver(post_save, sender=get_document_model())
+@receiver(post_delete, sender=get_document_model())
+@receiver(renditions_generated)
+def invalidate_site_bundle_on_media_change(sender, **kwargs):
+    # The bundle embeds image and document titles and URLs
+    site_bundle.invalidate()
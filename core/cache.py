@@ -0,0 +1,106 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+
+class Generation:
+    """
+    A token stored in the shared cache that changes whenever ``invalidate`` is
+    called. Cache keys that include it are abandoned on invalidation.
+
+    The token expires after CACHE_GENERATION_TIMEOUT seconds, which
+    invalidates everything keyed by it, so nothing outlives that even if an
+    invalidation is missed.
+
+    Each process reuses the token it read for CACHE_GENERATION_CHECK_INTERVAL
+    seconds, so most requests don't read it from the cache (a query with the
+    database cache), at the cost of seeing other processes' invalidations
+    that much later. Inside a transaction the token is always read, and not
+    kept: with the database cache, setting it is undone on rollback.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.key = f"core:generation:{name}"
+        # The token last read or set outside a transaction, and until when
+        # it's reused
+        self._local = None
+
+    def _in_transaction(self):
+        # The database cache always uses the default database
+        return connections["default"].in_atomic_block
+
+    def _remember(self, generation):
+        if not self._in_transaction():
+            self._local = (
+                generation,
+                time.monotonic() + settings.CACHE_GENERATION_CHECK_INTERVAL,
+            )
+
+    def get_timeout(self):
+        return settings.CACHE_GENERATION_TIMEOUT
+
+    def created(self):
+        """
+        Called once this process stores a new token because there was none:
+        on first use, or after the cache expired or dropped it.
+        """
+
+    def get(self):
+        local = self._local
+        if (
+            local is not None
+            and time.monotonic() < local[1]
+            and not self._in_transaction()
+        ):
+            return local[0]
+
+        generation = cache.get(self.key)
+        if generation is None:
+            if cache.add(self.key, uuid.uuid4().hex, self.get_timeout()):
+                self.created()
+            generation = cache.get(self.key)
+        self._remember(generation)
+        return generation
+
+    def _bump(self):
+        generation = uuid.uuid4().hex
+        cache.set(self.key, generation, self.get_timeout())
+        self._remember(generation)
+
+    def invalidate(self):
+        # Bump now so the current process sees its own writes, and again once
+        # the transaction commits so other processes never rebuild from
+        # uncommitted data.
+        self._bump()
+        transaction.on_commit(self._bump)
+
+
+class GenerationCache(Generation):
+    """
+    Keeps the value returned by ``builder`` in process memory and rebuilds it
+    once the generation token stored in the shared cache changes.
+
+    Calling ``invalidate`` replaces the token, so every process sharing the
+    cache rebuilds its copy on the next ``get``.
+    """
+
+    def __init__(self, name, builder):
+        super().__init__(name)
+        self.builder = builder
+        self._lock = threading.Lock()
+        self._generation = None
+        self._value = None
+
+    def get(self):
+        generation = super().get()
+        if generation != self._generation:
+            with self._lock:
+                if generation != self._generation:
+                    self._value = self.builder()
+                    self._generation = generation
+        return self._value
@@ -0,0 +1,90 @@
+import gzip
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Shorter bodies aren't worth compressing, as in GZipMiddleware
+MIN_COMPRESS_LENGTH = 200
+
+
+def get_encodings():
+    """
+    Returns the content encodings that bodies are stored in, preferred first.
+    """
+    if brotli is not None:
+        return ["br", "gzip"]
+    return ["gzip"]
+
+
+def compress(content):
+    """
+    Returns the content compressed in every encoding, by encoding name.
+
+    Bodies are compressed once when they're stored and served many times, so
+    they use the highest compression levels.
+    """
+    if len(content) < MIN_COMPRESS_LENGTH:
+        return {}
+
+    variants = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(content, quality=11)
+    return variants
+
+
+def get_accepted_encoding(request, encodings):
+    """
+    Returns the encoding of the given ones that the request accepts with the
+    highest quality (the first one given on a tie), or None if it accepts
+    none of them.
+    """
+    qualities = {}
+    for coding in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, *params = [part.strip() for part in coding.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+
+    accepted = None
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > 0 and (accepted is None or quality > accepted[1]):
+            accepted = (encoding, quality)
+    return accepted[0] if accepted else None
+
+
+def get_encoded_etag(etag, encoding):
+    """
+    Returns the ETag of the encoded representation, so each encoding has its
+    own strong ETag.
+    """
+    if etag is None or encoding is None:
+        return etag
+    return '%s-%s"' % (etag[:-1], encoding)
+
+
+def encoded_response(content, content_type, encoding=None, encoded_content=None):
+    """
+    Returns a response with the content in the given encoding, varying on
+    Accept-Encoding.
+    """
+    if encoding is not None and encoded_content is not None:
+        response = HttpResponse(encoded_content, content_type=content_type)
+        response["Content-Encoding"] = encoding
+    else:
+        response = HttpResponse(content, content_type=content_type)
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
@@ -0,0 +1,239 @@
+import functools
+import hashlib
+import json
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# Job functions by name
+registry = {}
+
+
+class JobFunction:
+    """
+    A function that can be called as usual, or queued to run in the
+    background with ``enqueue``.
+    """
+
+    def __init__(self, func, name, max_attempts, unique):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.unique = unique
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        """
+        Queues a call with the given (JSON serializable) arguments. It is
+        saved in the current transaction, so it only runs if it commits.
+
+        Unique jobs aren't queued again while an identical call is waiting to
+        run, and None is returned instead.
+        """
+        key = ""
+        if self.unique:
+            key = hashlib.sha1(
+                json.dumps(
+                    [self.name, args, kwargs], sort_keys=True, cls=DjangoJSONEncoder
+                ).encode()
+            ).hexdigest()
+            if Job.objects.filter(key=key, status=Job.QUEUED).exists():
+                return None
+
+        return Job.objects.create(
+            name=self.name,
+            key=key,
+            args=list(args),
+            kwargs=kwargs,
+            max_attempts=self.max_attempts or settings.JOBS_MAX_ATTEMPTS,
+            run_at=timezone.now(),
+        )
+
+
+def job(func=None, *, name=None, max_attempts=None, unique=False):
+    """
+    Registers a function as a job, by default under its dotted path.
+
+    The function runs in the run_jobs command, so its module must be imported
+    when the apps are ready. Failed calls are retried up to ``max_attempts``
+    times (JOBS_MAX_ATTEMPTS by default), waiting longer after each attempt.
+    """
+
+    def decorator(func):
+        job_function = JobFunction(
+            func,
+            name or f"{func.__module__}.{func.__qualname__}",
+            max_attempts,
+            unique,
+        )
+        registry[job_function.name] = job_function
+        return job_function
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+class Worker:
+    """
+    Runs the queued jobs in ``concurrency`` threads, each one claiming a job
+    at a time. Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so
+    several workers can share the queue.
+
+    A job that stays running for JOBS_LOCK_TIMEOUT seconds is considered
+    abandoned (e.g. its worker was killed) and is claimed again.
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or settings.JOBS_CONCURRENCY
+        self.stopping = threading.Event()
+
+    def claim(self):
+        """
+        Returns the next job due, marked as running, or None.
+        """
+        now = timezone.now()
+        abandoned = now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+        with transaction.atomic():
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=Job.QUEUED, run_at__lte=now)
+                    | Q(status=Job.RUNNING, locked_at__lt=abandoned)
+                )
+                .order_by("run_at", "id")
+                .first()
+            )
+            if job is None:
+                return None
+
+            job.status = Job.RUNNING
+            job.locked_at = now
+            job.attempts += 1
+            job.save(update_fields=["status", "locked_at", "attempts", "updated_at"])
+        return job
+
+    def run_job(self, job):
+        """
+        Runs the job, deleting it if it succeeds, and queueing it again or
+        marking it as failed otherwise.
+        """
+        queued = Job.objects.filter(pk=job.pk)
+        try:
+            if job.attempts > job.max_attempts:
+                raise RuntimeError("La tarea fue abandonada demasiadas veces")
+            job_function = registry.get(job.name)
+            if job_function is None:
+                raise LookupError(f"No existe la tarea {job.name}")
+            job_function(*job.args, **job.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            if job.attempts < job.max_attempts:
+                delay = settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1)
+                logger.warning(
+                    "La tarea %s (%s) falló, se reintentará en %d segundos",
+                    job.name,
+                    job.pk,
+                    delay,
+                    exc_info=True,
+                )
+                queued.update(
+                    status=Job.QUEUED,
+                    run_at=timezone.now() + timedelta(seconds=delay),
+                    locked_at=None,
+                    last_error=error,
+                    updated_at=timezone.now(),
+                )
+            else:
+                logger.error(
+                    "La tarea %s (%s) falló %d veces",
+                    job.name,
+                    job.pk,
+                    job.attempts,
+                    exc_info=True,
+                )
+                queued.update(
+                    status=Job.FAILED,
+                    locked_at=None,
+                    last_error=error,
+                    updated_at=timezone.now(),
+                )
+        else:
+            queued.delete()
+
+    def run_pending(self):
+        """
+        Runs the jobs that are due, in the current thread, until none is left.
+        Returns the number of jobs run.
+        """
+        count = 0
+        while not self.stopping.is_set():
+            job = self.claim()
+            if job is None:
+                break
+            self.run_job(job)
+            count += 1
+        return count
+
+    def _work(self, burst):
+        try:
+            while not self.stopping.is_set():
+                # Like a request would, drop the connections that are broken
+                # or older than CONN_MAX_AGE between jobs
+                close_old_connections()
+                try:
+                    job = self.claim()
+                except Exception:
+                    logger.exception("No se pudo obtener la siguiente tarea")
+                    job = None
+
+                if job is not None:
+                    try:
+                        self.run_job(job)
+                    except Exception:
+                        # e.g. the database went away while saving the outcome;
+                        # the job is claimed again after JOBS_LOCK_TIMEOUT
+                        logger.exception("No se pudo completar la tarea %s", job.pk)
+                elif burst:
+                    break
+                else:
+                    self.stopping.wait(settings.JOBS_POLL_INTERVAL)
+        finally:
+            connections.close_all()
+
+    def run(self, burst=False):
+        """
+        Runs jobs until ``stop`` is called or, in burst mode, until none is
+        due.
+        """
+        threads = [
+            threading.Thread(target=self._work, args=(burst,), name=f"jobs-{index}")
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # Join with a timeout, so the main thread still handles signals
+            while thread.is_alive():
+                thread.join(1)
+
+    def stop(self):
+        """
+        Makes the threads stop once their current job is done.
+        """
+        self.stopping.set()
@@ -0,0 +1,131 @@
+import datetime
+import json
+import timeit
+import uuid
+
+from django.core.management.base import BaseCommand
+from djangorestframework_camel_case.render import (
+    CamelCaseJSONRenderer as LibraryCamelCaseJSONRenderer,
+)
+from rest_framework.renderers import JSONRenderer
+
+from core import renderers
+from core.renderers import CamelCaseJSONRenderer, FastJSONRenderer
+
+
+def build_streamfield_payload(pages, blocks):
+    """
+    Returns a listing like the pages API outputs for pages with large
+    StreamFields of nested struct and list blocks.
+    """
+    now = datetime.datetime(2023, 5, 8, 15, 8, tzinfo=datetime.timezone.utc)
+    items = []
+    for page_id in range(pages):
+        content = []
+        for index in range(blocks):
+            content.append(
+                {
+                    "type": "card_block",
+                    "value": {
+                        "sup_title": "Sección %d" % index,
+                        "title": "Título del bloque %d" % index,
+                        "rich_text": "<p>Texto <b>enriquecido</b> del bloque</p>",
+                        "image": {
+                            "id": index,
+                            "title": "imagen_%d.jpg" % index,
+                            "download_url": "/media/original_images/imagen_%d.jpg"
+                            % index,
+                        },
+                        "link_items": [
+                            {
+                                "link_title": "Enlace %d" % link,
+                                "link_url": "https://example.com/%d" % link,
+                                "open_in_new_tab": bool(link % 2),
+                            }
+                            for link in range(3)
+                        ],
+                    },
+                    "id": str(uuid.uuid4()),
+                }
+            )
+        items.append(
+            {
+                "id": page_id,
+                "meta": {
+                    "type": "core.InformationPage",
+                    "detail_url": "http://localhost/api/pages/%d/" % page_id,
+                    "html_url": "http://localhost/pagina-%d/" % page_id,
+                    "first_published_at": now,
+                    "search_description": "",
+                    "show_in_menus": False,
+                },
+                "title": "Página %d" % page_id,
+                "content": content,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+    return {"meta": {"total_count": pages}, "items": items}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the JSON renderers of DRF (used by the API) and of "
+        "djangorestframework_camel_case with the project renderers on large "
+        "StreamField payloads"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=20)
+        parser.add_argument("--blocks", type=int, default=50)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = build_streamfield_payload(options["pages"], options["blocks"])
+        repeat = options["repeat"]
+
+        candidates = [
+            # The Wagtail API renders indented JSON
+            (
+                "rest_framework",
+                JSONRenderer(),
+                "core.renderers",
+                FastJSONRenderer(),
+                {"indent": 4},
+            ),
+            (
+                "djangorestframework_camel_case",
+                LibraryCamelCaseJSONRenderer(),
+                "core.renderers (camelCase)",
+                CamelCaseJSONRenderer(),
+                {},
+            ),
+        ]
+        for name, renderer, project_name, project_renderer, context in candidates:
+            expected = renderer.render(data, None, context)
+            output = project_renderer.render(data, None, context)
+            self.write_timing(name, renderer, data, context, repeat, expected)
+            self.write_timing(
+                project_name, project_renderer, data, context, repeat, output
+            )
+
+            # Without orjson the output is the same byte for byte
+            orjson = renderers.orjson
+            renderers.orjson = None
+            try:
+                stdlib_output = project_renderer.render(data, None, context)
+            finally:
+                renderers.orjson = orjson
+
+            if stdlib_output != expected or json.loads(output) != json.loads(expected):
+                self.stderr.write(
+                    f"Las salidas de {name} y {project_name} no coinciden"
+                )
+
+    def write_timing(self, name, renderer, data, context, repeat, output):
+        seconds = min(
+            timeit.repeat(
+                lambda: renderer.render(data, None, context), number=1, repeat=repeat
+            )
+        )
+        self.stdout.write(f"{name}: {seconds * 1000:.2f} ms ({len(output)} bytes)")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from wagtail.images import get_image_model
+
+from core.renditions import generate_renditions
+
+
+class Command(BaseCommand):
+    help = "Generates the missing API renditions of every image"
+
+    def handle(self, *args, **options):
+        image_ids = get_image_model().objects.values_list("id", flat=True)
+        for image_id in image_ids.iterator():
+            generate_renditions(image_id)
+
+        self.stdout.write(f"Se revisaron las versiones de {image_ids.count()} imágenes")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from wagtail.models import Page
+
+from core.models import PageSnapshot
+from core.snapshots import take_page_snapshots
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the API snapshots of every live page"
+
+    def handle(self, *args, **options):
+        PageSnapshot.objects.all().delete()
+
+        pages = (
+            Page.objects.live()
+            .filter(live_revision__isnull=False)
+            .only("id", "path")
+            .order_by("path")
+        )
+        for page in pages.iterator():
+            take_page_snapshots(page)
+
+        self.stdout.write(
+            f"Se generaron {PageSnapshot.objects.count()} snapshots de páginas"
+        )
@@ -0,0 +1,34 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = "Runs the background jobs as they are queued"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=None,
+            help="Number of jobs run at once (JOBS_CONCURRENCY by default)",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="Exit once there are no jobs due",
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(options["concurrency"])
+
+        def stop(signum, frame):
+            self.stdout.write("Terminando las tareas en curso...")
+            worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        worker.run(burst=options["burst"])
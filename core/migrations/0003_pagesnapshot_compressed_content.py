@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_pagesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='content_br',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pagesnapshot',
+            name='content_gzip',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_email', models.TextField(verbose_name='Remitente')),
+                ('recipients', models.JSONField(verbose_name='Destinatarios')),
+                ('message', models.BinaryField()),
+                ('failed', models.BooleanField(default=False, verbose_name='Fallido')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Último error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Correo saliente',
+                'verbose_name_plural': 'Correos salientes',
+            },
+        ),
+    ]
@@ -18,6 +18,7 @@ from wagtail.contrib.settings.models import (
 )
 
 from core import blocks
+from core.renditions import ImageRenditionsField
 
 
 @register_setting
@@ -65,6 +66,27 @@ class EmailSettings(BaseGenericSetting):
         verbose_name = "Configuración SMTP"
 
 
+class OutgoingEmail(models.Model):
+    """
+    A message in the outbox, waiting to be sent over SMTP by a background job,
+    see core.smtp.
+    """
+
+    from_email = models.TextField(verbose_name=_("Remitente"))
+    recipients = models.JSONField(verbose_name=_("Destinatarios"))
+    message = models.BinaryField()
+    failed = models.BooleanField(verbose_name=_("Fallido"), default=False)
+    last_error = models.TextField(verbose_name=_("Último error"), blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Correo saliente")
+        verbose_name_plural = _("Correos salientes")
+
+    def __str__(self):
+        return ", ".join(self.recipients)
+
+
 @receiver(post_save, sender=EmailSettings)
 def update_settings(sender, instance, **kwargs):
     from django.conf import settings
@@ -108,7 +130,7 @@ class HomePage(Page):
         FieldPanel("payment_methods", classname="collapsible, collapsed"),
     ]
     api_fields = [
-        APIField("banner"),
+        APIField("banner", serializer=ImageRenditionsField()),
         APIField("sup_title"),
         APIField("reinsurers_items"),
         APIField("payment_methods"),
@@ -160,7 +182,7 @@ class ReinsurersItem(Orderable):
     api_fields = [
         APIField("title"),
         APIField("url"),
-        APIField("image"),
+        APIField("image", serializer=ImageRenditionsField()),
         APIField("is_active"),
         APIField("created_at"),
         APIField("updated_at"),
@@ -405,3 +427,72 @@ class FooterPage(Page):
                 return "CAMBIOS SIN PUBLICAR"
             else:
                 return "PUBLICADO"
+
+
+class PageSnapshot(models.Model):
+    """
+    The rendered detail API response of a live page revision, as served to
+    public requests on a site.
+    """
+
+    page = models.ForeignKey(
+        "wagtailcore.Page", on_delete=models.CASCADE, related_name="+"
+    )
+    revision = models.ForeignKey(
+        "wagtailcore.Revision", on_delete=models.CASCADE, related_name="+"
+    )
+    site = models.ForeignKey(
+        "wagtailcore.Site", on_delete=models.CASCADE, related_name="+"
+    )
+    generation = models.CharField(max_length=32)
+    content = models.TextField()
+    content_gzip = models.BinaryField(null=True, blank=True)
+    content_br = models.BinaryField(null=True, blank=True)
+    etag = models.CharField(max_length=40)
+    last_modified = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Snapshot de página")
+        verbose_name_plural = _("Snapshots de páginas")
+        unique_together = [("page", "site")]
+
+
+class Job(models.Model):
+    """
+    A function call queued to run in the background by the run_jobs command,
+    see core.jobs. Jobs are deleted once they succeed.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (QUEUED, _("En cola")),
+        (RUNNING, _("En ejecución")),
+        (FAILED, _("Fallida")),
+    )
+
+    name = models.CharField(verbose_name=_("Tarea"), max_length=255)
+    key = models.CharField(max_length=40, blank=True, default="", db_index=True)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(
+        verbose_name=_("Estado"), choices=STATUS_CHOICES, default=QUEUED, max_length=7
+    )
+    attempts = models.PositiveIntegerField(verbose_name=_("Intentos"), default=0)
+    max_attempts = models.PositiveIntegerField(verbose_name=_("Máximo de intentos"))
+    run_at = models.DateTimeField(verbose_name=_("Ejecutar desde"))
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(verbose_name=_("Último error"), blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Tarea en segundo plano")
+        verbose_name_plural = _("Tareas en segundo plano")
+        indexes = [models.Index(fields=["status", "run_at"])]
+
+    def __str__(self):
+        return self.name
@@ -1,22 +1,125 @@
+import base64
+import binascii
+import hashlib
+import json
+import operator
 from collections import OrderedDict
+from functools import reduce
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q, QuerySet
 from rest_framework.pagination import BasePagination
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 
+from core.api_cache import page_content
+
+
+def estimate_count(queryset):
+    """
+    Returns the row estimate of the query planner on MySQL, and the exact
+    count on other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "mysql":
+        return queryset.count()
+
+    sql, params = queryset.values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN " + sql, params)
+        columns = [column[0] for column in cursor.description]
+        plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    # Multiply the rows expected from each table joined by the outer query
+    estimates = [
+        (row["rows"] or 0) * float(row.get("filtered") or 100) / 100
+        for row in plan
+        if row["id"] == 1
+    ]
+    return int(reduce(operator.mul, estimates, 1))
+
+
+def cached_count(queryset):
+    """
+    Returns the count of the queryset, cached per SQL query until the page
+    content changes.
+    """
+    sql, params = queryset.query.sql_with_params()
+    key = "core:api:count:%s:%s" % (
+        page_content.get(),
+        hashlib.sha1(repr((sql, params)).encode()).hexdigest(),
+    )
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count)
+    return count
+
 
 class WagtailAPIPagination(BasePagination):
+    # Fields that the cursor mode can paginate on, always with the primary key
+    # as tie-breaker
+    cursor_ordering_fields = ["id", "path", "first_published_at", "last_published_at"]
+
+    # Values of the "count" query parameter:
+    # - exact: count the matching rows on every request
+    # - cached: reuse the exact count until the page content changes
+    # - estimate: use the database planner's estimate
+    # - none: skip the count and only report whether there is a next page
+    count_modes = ["exact", "cached", "estimate", "none"]
+
+    def get_count_mode(self, request, default):
+        count_mode = request.GET.get("count", default)
+        if count_mode not in self.count_modes:
+            raise ValidationError(
+                "count must be one of: %s" % ", ".join(self.count_modes)
+            )
+        return count_mode
+
+    def get_request_count_mode(self, request):
+        """
+        Returns the count mode of the request. Counting is opt-in in cursor
+        mode, whatever WAGTAILAPI_COUNT_MODE says.
+        """
+        if "cursor" in request.GET:
+            return self.get_count_mode(request, "none")
+        return self.get_count_mode(
+            request, getattr(settings, "WAGTAILAPI_COUNT_MODE", "exact")
+        )
+
+    def get_total_count(self, queryset, count_mode):
+        # The view may already know the exact count (e.g. from computing validators)
+        count = getattr(self.view, "listing_count", None)
+        if count is not None:
+            return count
+
+        # Search results can only be counted exactly
+        if count_mode == "exact" or not isinstance(queryset, QuerySet):
+            return queryset.count()
+
+        if count_mode == "cached":
+            return cached_count(queryset)
+
+        return estimate_count(queryset)
+
+    def is_streamed(self, queryset):
+        """
+        Returns whether the view streams the page of the queryset. It then
+        loads the pages a chunk at a time, so only their primary keys are
+        fetched here.
+        """
+        return (
+            isinstance(queryset, QuerySet)
+            and self.view is not None
+            and getattr(self.view, "is_streaming", lambda: False)()
+        )
+
     def paginate_queryset(self, queryset, request, view=None):
         limit_max = getattr(settings, "WAGTAILAPI_LIMIT_MAX", 20)
         limit_default = getattr(settings, "WAGTAILAPI_LIMIT_DEFAULT", 20)
 
-        try:
-            offset = int(request.GET.get("offset", 0))
-            if offset < 0:
-                raise ValueError()
-        except ValueError:
-            raise ValidationError("offset must be a positive integer")
-
         try:
             limit = int(request.GET.get("limit", limit_default))
             if limit < 0:
@@ -27,24 +130,172 @@ class WagtailAPIPagination(BasePagination):
         if limit_max and limit > limit_max:
             raise ValidationError("limit cannot be higher than %d" % limit_max)
 
+        self.view = view
+
+        if "cursor" in request.GET:
+            return self.paginate_queryset_by_cursor(queryset, request, limit)
+
+        try:
+            offset = int(request.GET.get("offset", 0))
+            if offset < 0:
+                raise ValueError()
+        except ValueError:
+            raise ValidationError("offset must be a positive integer")
+
         start = offset
         stop = offset + limit
 
-        self.view = view
-        self.total_count = queryset.count()
+        count_mode = self.get_request_count_mode(request)
+        if count_mode == "none" and self.is_streamed(queryset):
+            # Fetch one extra key to know whether there is a next page
+            page_ids = list(queryset.values_list("pk", flat=True)[start : stop + 1])
+            self.meta = OrderedDict(
+                [
+                    ("has_next", len(page_ids) > limit),
+                ]
+            )
+            return queryset.filter(pk__in=page_ids[:limit])
+
+        if count_mode == "none":
+            # Fetch one extra row to know whether there is a next page
+            items = list(queryset[start : stop + 1])
+            self.meta = OrderedDict(
+                [
+                    ("has_next", len(items) > limit),
+                ]
+            )
+            return items[:limit]
+
+        self.meta = OrderedDict(
+            [
+                ("total_count", self.get_total_count(queryset, count_mode)),
+            ]
+        )
         return queryset[start:stop]
 
+    def get_cursor_ordering(self, queryset):
+        """
+        Returns the field the queryset is ordered by and whether the order is
+        descending, or raises a ValidationError if the cursor mode can't
+        paginate on it.
+        """
+        ordering = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        if not ordering:
+            ordering = ["id"]
+
+        field_name = ordering[0]
+        descending = field_name.startswith("-")
+        field_name = field_name.lstrip("-")
+        if field_name == "pk":
+            field_name = "id"
+
+        if field_name not in self.cursor_ordering_fields or ordering[1:] not in (
+            [],
+            ["id"],
+            ["pk"],
+        ):
+            raise ValidationError(
+                "cursor cannot be used with this ordering. Order by one of: %s"
+                % ", ".join(self.cursor_ordering_fields)
+            )
+
+        if not queryset.query.standard_ordering:
+            descending = not descending
+
+        return field_name, descending
+
+    def encode_cursor(self, ordering, value, pk):
+        cursor = json.dumps([ordering, value, pk])
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    def decode_cursor(self, cursor, ordering, field):
+        try:
+            cursor_ordering, value, pk = json.loads(base64.urlsafe_b64decode(cursor))
+            value = field.to_python(value)
+        except (binascii.Error, ValueError, TypeError, DjangoValidationError):
+            raise ValidationError("cursor is invalid")
+
+        if cursor_ordering != ordering:
+            raise ValidationError("cursor doesn't match the current ordering")
+
+        return value, pk
+
+    def paginate_queryset_by_cursor(self, queryset, request, limit):
+        """
+        Returns the page after the given cursor, seeking on the ordering field
+        and the primary key instead of skipping rows with an offset, so every
+        page costs the same to fetch. No total count is computed.
+
+        Rows without a value in the ordering field are left out.
+        """
+        if not isinstance(queryset, QuerySet):
+            raise ValidationError("cursor cannot be used when searching")
+
+        if "offset" in request.GET:
+            raise ValidationError("cursor and offset cannot be used together")
+
+        count_mode = self.get_request_count_mode(request)
+        total_count = (
+            self.get_total_count(queryset, count_mode) if count_mode != "none" else None
+        )
+
+        field_name, descending = self.get_cursor_ordering(queryset)
+        field = queryset.model._meta.get_field(field_name)
+        ordering = ("-" if descending else "") + field_name
+        lookup = "lt" if descending else "gt"
+
+        if field.null:
+            queryset = queryset.filter(**{field_name + "__isnull": False})
+
+        if request.GET["cursor"]:
+            value, pk = self.decode_cursor(request.GET["cursor"], ordering, field)
+            if field_name == "id":
+                queryset = queryset.filter(**{"id__" + lookup: pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{field_name + "__" + lookup: value})
+                    | Q(**{field_name: value, "id__" + lookup: pk})
+                )
+
+        if not queryset.query.standard_ordering:
+            # Undo reverse(), the direction is now part of the ordering below
+            queryset = queryset.reverse()
+
+        if field_name == "id":
+            queryset = queryset.order_by(ordering)
+        else:
+            queryset = queryset.order_by(ordering, ("-" if descending else "") + "id")
+
+        # Fetch one extra row to know whether there is a next page
+        if self.is_streamed(queryset):
+            keys = list(queryset.values_list("pk", field.attname)[: limit + 1])
+            items = queryset.filter(pk__in=[pk for pk, value in keys[:limit]])
+        else:
+            items = list(queryset[: limit + 1])
+            keys = [(item.pk, field.value_from_object(item)) for item in items]
+            items = items[:limit]
+
+        next_cursor = None
+        if limit and len(keys) > limit:
+            pk, value = keys[limit - 1]
+            last = queryset.model(**{"id": pk, field.attname: value})
+            next_cursor = self.encode_cursor(
+                ordering, field.value_to_string(last), pk
+            )
+
+        self.meta = OrderedDict(
+            [
+                ("next", next_cursor),
+            ]
+        )
+        if total_count is not None:
+            self.meta["total_count"] = total_count
+        return items
+
     def get_paginated_response(self, data):
         data = OrderedDict(
             [
-                (
-                    "meta",
-                    OrderedDict(
-                        [
-                            ("total_count", self.total_count),
-                        ]
-                    ),
-                ),
+                ("meta", self.meta),
                 ("items", data),
             ]
         )
@@ -0,0 +1,214 @@
+import json
+import math
+import re
+
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from djangorestframework_camel_case.settings import api_settings as camel_case_settings
+from djangorestframework_camel_case.util import camelize_re, underscore_to_camel
+from rest_framework.compat import INDENT_SEPARATORS, LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Keys are mostly field and block names, so the table stays small. It stops
+# growing past this size in case the payloads use data as keys
+CAMEL_KEYS_MAX_SIZE = 10000
+
+camel_keys = {}
+
+
+def camelize_key(key):
+    """
+    Returns the camelCase version of a snake_case key, like
+    djangorestframework_camel_case does, remembering every key converted.
+    """
+    try:
+        return camel_keys[key]
+    except KeyError:
+        pass
+
+    if isinstance(key, Promise):
+        key = force_str(key)
+    if isinstance(key, str) and "_" in key:
+        camel_key = re.sub(camelize_re, underscore_to_camel, key)
+    else:
+        camel_key = key
+
+    if len(camel_keys) < CAMEL_KEYS_MAX_SIZE:
+        camel_keys[key] = camel_key
+    return camel_key
+
+
+class CamelCaseTransform:
+    """
+    Converts the data to plain JSON types in a single walk: dict keys are
+    camelized, and every value the JSON encoder would pass to its ``default``
+    method is converted on the way, so the encoder doesn't need a fallback.
+
+    The output is the same as camelizing the data with
+    djangorestframework_camel_case and then encoding it with DRF's encoder.
+    """
+
+    scalar_types = (str, int, bool, type(None))
+
+    def __init__(
+        self, encoder_class, strict=True, ignore_fields=None, ignore_keys=None, **options
+    ):
+        self.encoder = encoder_class()
+        self.strict = strict
+        self.ignore_fields = ignore_fields or ()
+        self.ignore_keys = ignore_keys or ()
+
+    def __call__(self, data, camelize=True):
+        if isinstance(data, self.scalar_types):
+            return data
+
+        if isinstance(data, float):
+            if self.strict and (math.isnan(data) or math.isinf(data)):
+                raise ValueError("Out of range float values are not JSON compliant")
+            return data
+
+        if isinstance(data, Promise):
+            return force_str(data)
+
+        if isinstance(data, dict):
+            if not camelize:
+                return {key: self(value, False) for key, value in data.items()}
+            return self.transform_dict(data)
+
+        if isinstance(data, (list, tuple)):
+            return [self(item, camelize) for item in data]
+
+        # Like camelize, walk any other iterable as a list
+        if camelize and hasattr(data, "__iter__"):
+            try:
+                items = iter(data)
+            except TypeError:
+                pass
+            else:
+                return [self(item) for item in items]
+
+        return self(self.encoder.default(data), camelize)
+
+    def transform_dict(self, data):
+        if not self.ignore_fields and not self.ignore_keys:
+            return {camelize_key(key): self(value) for key, value in data.items()}
+
+        result = {}
+        for key, value in data.items():
+            camel_key = camelize_key(key)
+            camelize = key not in self.ignore_fields and camel_key not in self.ignore_fields
+            if key in self.ignore_keys or camel_key in self.ignore_keys:
+                camel_key = key
+            result[camel_key] = self(value, camelize)
+        return result
+
+
+def can_use_orjson(renderer, indent):
+    """
+    Returns whether orjson, if installed, writes the same JSON as the
+    renderer. It only indents by two spaces, which is scaled to even indents.
+    """
+    return (
+        orjson is not None
+        and (indent is None or indent % 2 == 0)
+        and renderer.compact
+        and not renderer.ensure_ascii
+    )
+
+
+def scale_indentation(ret, scale):
+    """
+    Multiplies the indentation of JSON that orjson indented by two spaces.
+    Strings never hold raw newlines, so every line starts with indentation.
+    """
+    lines = []
+    for line in ret.split(b"\n"):
+        indentation = line[: len(line) - len(line.lstrip(b" "))]
+        lines.append(indentation * (scale - 1) + line)
+    return b"\n".join(lines)
+
+
+def orjson_dumps(data, default=None, indent=None):
+    # Leave dates and times to the encoder, which formats them differently
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    ret = orjson.dumps(data, default=default, option=option)
+
+    if indent and indent != 2:
+        ret = scale_indentation(ret, indent // 2)
+
+    # Fully escape \u2028 and \u2029 like JSONRenderer
+    return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+        b"\xe2\x80\xa9", b"\\u2029"
+    )
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    A faster drop-in for DRF's JSON renderer, which encodes with orjson when
+    it's installed. The standard library encodes indented JSON (which the
+    Wagtail API always asks for) in pure Python.
+
+    Values that orjson can't encode, or encodes differently, are passed to
+    the encoder's ``default`` method like the standard library would. orjson
+    may write some floats differently (e.g. 1e16 instead of 1e+16).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if data is None or not can_use_orjson(self, indent):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson_dumps(data, default=self.encoder_class().default, indent=indent)
+
+
+class CamelCaseJSONRenderer(JSONRenderer):
+    """
+    A faster drop-in for djangorestframework_camel_case's renderer.
+
+    Keys are camelized through a lookup table and the values converted in the
+    same walk, then the result is encoded with orjson, when it's installed
+    and can write the indentation asked for, or with the standard library
+    otherwise. Both produce the same JSON, though orjson may write some
+    floats differently (e.g. 1e16 instead of 1e+16).
+    """
+
+    json_underscoreize = camel_case_settings.JSON_UNDERSCOREIZE
+
+    def get_transform(self):
+        return CamelCaseTransform(
+            self.encoder_class, strict=self.strict, **self.json_underscoreize
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        data = self.get_transform()(data)
+
+        if can_use_orjson(self, indent):
+            return orjson_dumps(data, indent=indent)
+
+        if indent is None:
+            separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        else:
+            separators = INDENT_SEPARATORS
+
+        ret = json.dumps(
+            data,
+            indent=indent,
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=separators,
+        )
+        ret = ret.replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+        return ret.encode()
+
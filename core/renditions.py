@@ -0,0 +1,158 @@
+import os
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.dispatch import Signal
+from rest_framework import relations
+
+from wagtail.api.v2.serializers import get_serializer_class
+from wagtail.images import get_image_model
+from wagtail.images.api.v2.serializers import ImageSerializer
+from wagtail.images.models import Filter
+
+
+# Sent with the image id once renditions of the image have been generated
+renditions_generated = Signal()
+
+
+def get_rendition_specs():
+    """
+    Returns the filter specs of the API renditions: one per width in
+    API_IMAGE_RENDITION_WIDTHS and format in API_IMAGE_RENDITION_FORMATS.
+    """
+    specs = []
+    for output_format in settings.API_IMAGE_RENDITION_FORMATS:
+        for width in settings.API_IMAGE_RENDITION_WIDTHS:
+            spec = f"width-{width}"
+            if output_format != "original":
+                spec += f"|format-{output_format}"
+            specs.append(spec)
+    return specs
+
+
+def get_image_rendition_specs(image):
+    """
+    Returns the specs to generate for the image. Renditions aren't upscaled,
+    so widths above the image's are skipped, but for the smallest one.
+    """
+    specs = []
+    smallest = min(settings.API_IMAGE_RENDITION_WIDTHS)
+    for spec in get_rendition_specs():
+        width = int(spec.split("|")[0][len("width-") :])
+        if width <= image.width or width == smallest:
+            specs.append(spec)
+    return specs
+
+
+def generate_renditions(image_id):
+    """
+    Creates the missing API renditions of the image.
+    """
+    Image = get_image_model()
+    image = (
+        Image.objects.prefetch_renditions(*get_rendition_specs())
+        .filter(pk=image_id)
+        .first()
+    )
+    if image is None:
+        return
+
+    created = False
+    for spec in get_image_rendition_specs(image):
+        rendition_filter = Filter(spec=spec)
+        try:
+            image.find_existing_rendition(rendition_filter)
+        except image.get_rendition_model().DoesNotExist:
+            image.get_rendition(rendition_filter)
+            created = True
+
+    if created:
+        renditions_generated.send(sender=Image, image_id=image_id)
+
+
+def get_renditions_prefetch(lookup):
+    """
+    Returns the prefetch of the API renditions of the images that ``lookup``
+    relates to, for get_image_renditions.
+    """
+    Rendition = get_image_model().get_rendition_model()
+    return Prefetch(
+        f"{lookup}__renditions",
+        queryset=Rendition.objects.filter(filter_spec__in=get_rendition_specs()),
+        to_attr="prefetched_renditions",
+    )
+
+
+def get_image_renditions(image):
+    """
+    Returns the existing API renditions of the image, and their srcset by
+    format. Renditions are never generated here: prefetch them with
+    get_renditions_prefetch to avoid a query per image.
+    """
+    specs = get_rendition_specs()
+    renditions = getattr(image, "prefetched_renditions", None)
+    if renditions is None:
+        renditions = image.renditions.filter(filter_spec__in=specs)
+
+    by_spec = {}
+    for rendition in renditions:
+        if rendition.filter_spec in specs and rendition.focal_point_key == Filter(
+            spec=rendition.filter_spec
+        ).get_cache_key(image):
+            by_spec[rendition.filter_spec] = rendition
+
+    output = []
+    srcset = {}
+    seen = set()
+    for spec in specs:
+        rendition = by_spec.get(spec)
+        if rendition is None:
+            continue
+        output_format = os.path.splitext(rendition.file.name)[1][1:].lower()
+        if output_format == "jpg":
+            output_format = "jpeg"
+        # Widths above the image's share the original size
+        if (output_format, rendition.width) in seen:
+            continue
+        seen.add((output_format, rendition.width))
+
+        url = f"{settings.WAGTAILADMIN_BASE_URL}{rendition.url}"
+        output.append(
+            {
+                "url": url,
+                "width": rendition.width,
+                "height": rendition.height,
+                "format": output_format,
+            }
+        )
+        srcset.setdefault(output_format, []).append(f"{url} {rendition.width}w")
+
+    return {
+        "renditions": output,
+        "srcset": {
+            output_format: ", ".join(sources) for output_format, sources in srcset.items()
+        },
+    }
+
+
+class ImageRenditionsField(relations.RelatedField):
+    """
+    Serializes an image foreign key like the API does by default, along with
+    the renditions of the image.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        serializer_class = get_serializer_class(
+            value.__class__,
+            ["id", "type", "detail_url", "download_url", "title"],
+            meta_fields=["type", "detail_url", "download_url"],
+            base=ImageSerializer,
+        )
+        serializer = serializer_class(context=self.context)
+        data = serializer.to_representation(value)
+        data.update(get_image_renditions(value))
+        return data
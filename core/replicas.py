@@ -0,0 +1,163 @@
+import asyncio
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from wagtail.models import Page, PageViewRestriction, Revision, Site
+
+from core.async_views import run_in_executor
+
+
+PRIMARY_UNTIL_KEY = "core:replicas:primary_until"
+
+# Whether the database reads of the current request may go to a replica
+use_replicas = contextvars.ContextVar("use_replicas", default=False)
+
+_primary_until = 0
+
+
+def get_replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def stick_to_primary():
+    """
+    Sends every read to the primary for REPLICA_LAG_SECONDS once the current
+    transaction commits, so the replicas can catch up with its writes.
+
+    Reads right after a write would otherwise get the old data from a lagging
+    replica, and could even store it in the caches the write invalidated.
+    """
+    if not get_replicas():
+        return
+
+    def stick():
+        global _primary_until
+        now = time.time()
+        # Writes in a row only need to push the window forward once in a while
+        if _primary_until - now < settings.REPLICA_LAG_SECONDS / 2:
+            _primary_until = now + settings.REPLICA_LAG_SECONDS
+            cache.set(PRIMARY_UNTIL_KEY, _primary_until, settings.REPLICA_LAG_SECONDS)
+
+    transaction.on_commit(stick)
+
+
+def is_sticky():
+    """
+    Returns whether reads must stay on the primary after a recent write.
+    """
+    return cache.get(PRIMARY_UNTIL_KEY, 0) > time.time()
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of the requests the replica middleware allows to a random
+    replica, and everything else to the default database.
+
+    Reads inside a transaction stay on the default database, to see its
+    writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if (
+            replicas
+            and use_replicas.get()
+            # The database cache holds the invalidation tokens, which must
+            # not lag behind
+            and model._meta.app_label != "django_cache"
+            and not connections["default"].in_atomic_block
+        ):
+            return random.choice(replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Lets the anonymous reads of the API and search read from the replicas,
+    unless there was a recent write. Editors and the admin always use the
+    primary, so they see their changes right away.
+
+    Under ASGI it runs as a coroutine, so it doesn't send the async API views
+    through Django's single thread for synchronous code.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Makes Django await the middleware, like MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        token = use_replicas.set(self.can_use_replicas(request))
+        try:
+            return self.get_response(request)
+        finally:
+            use_replicas.reset(token)
+
+    async def __acall__(self, request):
+        can_use_replicas = False
+        if get_replicas():
+            # Loading the user and reading the cache may query the database,
+            # which can't be used in the event loop
+            can_use_replicas = await run_in_executor(self.can_use_replicas, request)
+
+        token = use_replicas.set(can_use_replicas)
+        try:
+            return await self.get_response(request)
+        finally:
+            use_replicas.reset(token)
+
+    def can_use_replicas(self, request):
+        return (
+            bool(get_replicas())
+            and request.method in ("GET", "HEAD")
+            and request.path_info.startswith(tuple(settings.REPLICA_READ_PATHS))
+            and not request.user.is_authenticated
+            and not is_sticky()
+        )
+
+
+def is_content(instance):
+    """
+    Returns whether the instance is content that the API and search serve:
+    pages (which publishing, unpublishing and moving save), their revisions
+    and view restrictions, and sites.
+    """
+    return isinstance(instance, (Page, Revision, PageViewRestriction, Site))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def stick_to_primary_on_write(sender, instance, using=None, **kwargs):
+    # Other writes (snapshots, jobs, sessions...) don't change what the
+    # replicas serve, so they don't need to keep the reads on the primary
+    if using == "default" and is_content(instance):
+        stick_to_primary()
@@ -0,0 +1,130 @@
+from collections import defaultdict, namedtuple
+
+from django.db.models.functions import Substr
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from wagtail.models import BaseViewRestriction, PageViewRestriction
+from wagtail.signals import post_page_move
+
+from core.cache import GenerationCache
+
+
+RestrictedPath = namedtuple("RestrictedPath", ["restriction_id", "path", "group_ids"])
+
+
+def build_restriction_index():
+    """
+    Returns the tree paths of every restricted page, grouped by restriction type.
+    """
+    group_ids = defaultdict(set)
+    for restriction_id, group_id in PageViewRestriction.groups.through.objects.values_list(
+        "pageviewrestriction_id", "group_id"
+    ):
+        group_ids[restriction_id].add(group_id)
+
+    index = defaultdict(list)
+    for restriction_id, restriction_type, path in PageViewRestriction.objects.values_list(
+        "id", "restriction_type", "page__path"
+    ):
+        index[restriction_type].append(
+            RestrictedPath(restriction_id, path, frozenset(group_ids[restriction_id]))
+        )
+
+    return {
+        restriction_type: tuple(entries) for restriction_type, entries in index.items()
+    }
+
+
+restriction_index = GenerationCache("page_view_restrictions", build_restriction_index)
+
+
+def collapse_paths(paths):
+    """
+    Drops every path that is already covered by one of its ancestors.
+    """
+    collapsed = []
+    for path in sorted(set(paths)):
+        if not collapsed or not path.startswith(collapsed[-1]):
+            collapsed.append(path)
+    return tuple(collapsed)
+
+
+def get_restricted_paths(request):
+    """
+    Returns the tree paths of the pages (and their descendants) that the
+    request is not allowed to see.
+
+    This mirrors PageViewRestriction.accept_request, but works from the cached
+    index so no restriction rows are loaded per request.
+    """
+    index = restriction_index.get()
+    user = request.user
+    denied = []
+
+    if not user.is_authenticated:
+        denied.extend(entry.path for entry in index.get(BaseViewRestriction.LOGIN, ()))
+
+    password_entries = index.get(BaseViewRestriction.PASSWORD, ())
+    if password_entries:
+        passed_restrictions = request.session.get(
+            PageViewRestriction.passed_view_restrictions_session_key, []
+        )
+        denied.extend(
+            entry.path
+            for entry in password_entries
+            if entry.restriction_id not in passed_restrictions
+        )
+
+    group_entries = index.get(BaseViewRestriction.GROUPS, ())
+    if group_entries and not user.is_superuser:
+        user_group_ids = (
+            set(user.groups.values_list("id", flat=True))
+            if user.is_authenticated
+            else set()
+        )
+        denied.extend(
+            entry.path
+            for entry in group_entries
+            if not entry.group_ids & user_group_ids
+        )
+
+    return collapse_paths(denied)
+
+
+def get_public_restricted_paths():
+    """
+    Returns the tree paths of every restricted page, which are the ones hidden
+    from anonymous requests that haven't passed a password restriction.
+    """
+    return collapse_paths(
+        entry.path for entries in restriction_index.get().values() for entry in entries
+    )
+
+
+def exclude_restricted_paths(queryset, paths):
+    """
+    Excludes the pages under any of the given tree paths from a page queryset.
+
+    Paths are grouped by length, so the exclusion is one IN clause per tree
+    depth instead of one NOT LIKE clause per restricted page.
+    """
+    paths_by_length = defaultdict(list)
+    for path in paths:
+        paths_by_length[len(path)].append(path)
+
+    for length, prefixes in sorted(paths_by_length.items()):
+        alias = "restricted_path_%d" % length
+        queryset = queryset.alias(**{alias: Substr("path", 1, length)}).exclude(
+            **{alias + "__in": prefixes}
+        )
+
+    return queryset
+
+
+@receiver(post_save, sender=PageViewRestriction)
+@receiver(post_delete, sender=PageViewRestriction)
+@receiver(m2m_changed, sender=PageViewRestriction.groups.through)
+@receiver(post_page_move)
+def invalidate_restriction_index(sender, **kwargs):
+    restriction_index.invalidate()
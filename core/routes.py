@@ -0,0 +1,85 @@
+from collections import defaultdict, namedtuple
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from wagtail.models import Page, Site
+from wagtail.signals import (
+    page_published,
+    page_slug_changed,
+    page_unpublished,
+    post_page_move,
+)
+
+from core.cache import GenerationCache
+
+
+Route = namedtuple("Route", ["page_id", "path", "content_type_id"])
+
+
+def build_route_table():
+    """
+    Returns the live pages of every site keyed by their path relative to the
+    site root, which is what Page.route resolves when routing from the root
+    page.
+    """
+    roots = {
+        site.id: site.root_page.url_path
+        for site in Site.objects.select_related("root_page")
+    }
+
+    routes = defaultdict(dict)
+    for page_id, path, url_path, content_type_id in Page.objects.live().values_list(
+        "id", "path", "url_path", "content_type_id"
+    ):
+        for site_id, root_url_path in roots.items():
+            if url_path.startswith(root_url_path):
+                html_path = url_path[len(root_url_path) :].strip("/")
+                routes[site_id][html_path] = Route(page_id, path, content_type_id)
+
+    return dict(routes)
+
+
+route_table = GenerationCache("page_routes", build_route_table)
+
+
+def find_route(site, html_path):
+    """
+    Returns the live page that the path routes to from the site's root page,
+    or None.
+    """
+    if site is None:
+        return None
+    path_components = [component for component in html_path.split("/") if component]
+    return route_table.get().get(site.id, {}).get("/".join(path_components))
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+# Sent once a slug change, which also changes the url_path of every
+# descendant, is committed. Wagtail already loads the saved page to detect it
+@receiver(page_slug_changed)
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_route_table(sender, **kwargs):
+    route_table.invalidate()
+
+
+@receiver(post_save)
+def invalidate_route_table_for_page(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    # Pages created live, or whose status or url_path is saved on its own,
+    # without the signals above
+    if isinstance(instance, Page) and (
+        (created and instance.live)
+        or (update_fields and {"live", "url_path"} & set(update_fields))
+    ):
+        route_table.invalidate()
+
+
+@receiver(post_delete)
+def invalidate_route_table_on_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page):
+        route_table.invalidate()
@@ -0,0 +1,199 @@
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http.request import split_domain_port
+
+from wagtail.models import Page, Site
+from wagtail.models.sites import (
+    MATCH_DEFAULT,
+    MATCH_HOSTNAME,
+    MATCH_HOSTNAME_DEFAULT,
+    MATCH_HOSTNAME_PORT,
+)
+from wagtail.signals import post_page_move
+
+from core.cache import GenerationCache
+
+
+SiteInfo = namedtuple(
+    "SiteInfo",
+    [
+        "id",
+        "hostname",
+        "port",
+        "site_name",
+        "is_default_site",
+        "root_page_id",
+        "root_page_content_type_id",
+        "root_paths",
+    ],
+)
+
+SiteIndex = namedtuple("SiteIndex", ["sites", "page_ids", "translation_keys"])
+
+
+def build_site_index():
+    """
+    Returns every site with the tree paths of its root page and, when i18n is
+    enabled, of the root page translations.
+    """
+    sites = list(Site.objects.select_related("root_page"))
+    translation_keys = {site.root_page.translation_key for site in sites}
+    page_ids = {site.root_page_id for site in sites}
+
+    translation_paths = defaultdict(set)
+    if getattr(settings, "WAGTAIL_I18N_ENABLED", False):
+        for page_id, translation_key, path in Page.objects.filter(
+            translation_key__in=translation_keys
+        ).values_list("id", "translation_key", "path"):
+            page_ids.add(page_id)
+            translation_paths[translation_key].add(path)
+
+    return SiteIndex(
+        sites=tuple(
+            SiteInfo(
+                id=site.id,
+                hostname=site.hostname,
+                port=site.port,
+                site_name=site.site_name,
+                is_default_site=site.is_default_site,
+                root_page_id=site.root_page_id,
+                root_page_content_type_id=site.root_page.content_type_id,
+                root_paths=tuple(
+                    sorted(
+                        translation_paths[site.root_page.translation_key]
+                        | {site.root_page.path}
+                    )
+                ),
+            )
+            for site in sites
+        ),
+        page_ids=frozenset(page_ids),
+        translation_keys=frozenset(translation_keys),
+    )
+
+
+site_index = GenerationCache("sites", build_site_index)
+
+
+def find_site(hostname, port=None):
+    """
+    Returns the site with the given hostname (and port, if given).
+
+    Raises Site.DoesNotExist or Site.MultipleObjectsReturned like
+    Site.objects.get would.
+    """
+    sites = [
+        site
+        for site in site_index.get().sites
+        if site.hostname == hostname and (port is None or str(site.port) == str(port))
+    ]
+    if not sites:
+        raise Site.DoesNotExist()
+    if len(sites) > 1:
+        raise Site.MultipleObjectsReturned()
+    return sites[0]
+
+
+def find_site_for_request(request):
+    """
+    Returns the site responsible for the request, following the same matching
+    rules as Site.find_for_request, or None if there is no match.
+
+    Like Site.find_for_request, the result is remembered on the request, so
+    later calls to Site.find_for_request (e.g. when building detail URLs) don't
+    hit the database either.
+    """
+    request = getattr(request, "_request", request)
+    if not hasattr(request, "_core_site"):
+        request._core_site = _match_site(request)
+        if not hasattr(request, "_wagtail_site"):
+            request._wagtail_site = get_site_instance(request._core_site)
+    return request._core_site
+
+
+def get_site_instance(site):
+    """
+    Returns a Site instance built from the cached site info, without a query.
+    """
+    if site is None:
+        return None
+    return Site(
+        id=site.id,
+        hostname=site.hostname,
+        port=site.port,
+        site_name=site.site_name,
+        root_page_id=site.root_page_id,
+        is_default_site=site.is_default_site,
+    )
+
+
+def _match_site(request):
+    hostname = split_domain_port(request.get_host())[0]
+    port = str(request.get_port())
+
+    matches = []
+    for site in site_index.get().sites:
+        if site.hostname == hostname and str(site.port) == port:
+            matches.append((MATCH_HOSTNAME_PORT, site))
+        elif site.hostname == hostname and site.is_default_site:
+            matches.append((MATCH_HOSTNAME_DEFAULT, site))
+        elif site.is_default_site:
+            matches.append((MATCH_DEFAULT, site))
+        elif site.hostname == hostname:
+            matches.append((MATCH_HOSTNAME, site))
+
+    if not matches:
+        return None
+
+    matches.sort(key=lambda match: match[0])
+    if len(matches) == 1 or matches[0][0] in (
+        MATCH_HOSTNAME_PORT,
+        MATCH_HOSTNAME_DEFAULT,
+    ):
+        return matches[0][1]
+
+    if matches[0][0] == MATCH_DEFAULT:
+        return matches[len(matches) == 2][1]
+
+    return None
+
+
+def site_pages_q(site):
+    """
+    Returns a Q object matching the pages inside the site's root page, or any
+    of its translations.
+    """
+    q = Q()
+    for path in site.root_paths:
+        q |= Q(path__startswith=path)
+    return q
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+@receiver(post_page_move)
+def invalidate_site_index(sender, **kwargs):
+    site_index.invalidate()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_site_index_for_page(sender, instance, created=True, **kwargs):
+    # Saving or deleting sites (which deleting their root page does) and moving
+    # pages invalidate the index on their own, and saving a page doesn't change
+    # what the index holds, so only adding or deleting a translation of a root
+    # page can. Deletions don't pass "created".
+    if (
+        not isinstance(instance, Page)
+        or not created
+        or not getattr(settings, "WAGTAIL_I18N_ENABLED", False)
+    ):
+        return
+
+    sites = Site.objects.filter(root_page__translation_key=instance.translation_key)
+    if sites.exists():
+        site_index.invalidate()
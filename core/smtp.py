@@ -1,17 +1,156 @@
-from django.core.mail.backends.smtp import EmailBackend as BaseEmailBackend
-from core.models import EmailSettings
+import smtplib
+import threading
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as SMTPEmailBackend
+from django.core.mail.message import sanitize_address
+from django.db import transaction
+
+from core.jobs import job
+from core.models import EmailSettings, OutgoingEmail
 
 
 class EmailBackend(BaseEmailBackend):
-    def __init__(self, fail_silently, **kwargs):
-        config = EmailSettings.load()
-
-        super().__init__(
-            fail_silently=fail_silently,
-            host=config.email_host,
-            port=config.email_port,
-            username=config.email_user,
-            password=config.email_password,
-            use_tls=config.email_encryption == "TLS",
-            use_ssl=config.email_encryption == "SSL",
-        )
+    """
+    Saves the messages to the outbox and queues the job that sends them, so
+    sending mail doesn't wait on the SMTP server.
+    """
+
+    def send_messages(self, email_messages):
+        emails = []
+        for message in email_messages:
+            recipients = message.recipients()
+            if not recipients:
+                continue
+            encoding = message.encoding or settings.DEFAULT_CHARSET
+            emails.append(
+                OutgoingEmail(
+                    from_email=sanitize_address(message.from_email, encoding),
+                    recipients=[
+                        sanitize_address(address, encoding) for address in recipients
+                    ],
+                    message=message.message().as_bytes(linesep="\r\n"),
+                )
+            )
+        if not emails:
+            return 0
+
+        try:
+            with transaction.atomic():
+                OutgoingEmail.objects.bulk_create(emails)
+                send_queued_emails.enqueue()
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(emails)
+
+
+def get_smtp_config():
+    config = EmailSettings.load()
+    return {
+        "host": config.email_host,
+        "port": config.email_port,
+        "username": config.email_user,
+        "password": config.email_password,
+        "use_tls": config.email_encryption == "TLS",
+        "use_ssl": config.email_encryption == "SSL",
+    }
+
+
+def is_rejection(exception):
+    """
+    Returns whether the SMTP server rejected the message for good, rather
+    than failing temporarily.
+    """
+    if isinstance(exception, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, message in exception.recipients.values())
+    return isinstance(exception, smtplib.SMTPResponseException) and (
+        exception.smtp_code >= 500
+    )
+
+
+class SMTPSender:
+    """
+    Keeps one authenticated SMTP connection open in the process, and only
+    opens a new one when the SMTP settings change or the server drops it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.backend = None
+        self.config = None
+
+    def get_connection(self, config):
+        if self.backend is not None and config != self.config:
+            self.close()
+        if self.backend is None:
+            backend = SMTPEmailBackend(fail_silently=False, **config)
+            backend.open()
+            self.backend, self.config = backend, config
+        return self.backend.connection
+
+    def close(self):
+        if self.backend is not None:
+            try:
+                self.backend.close()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.backend = self.config = None
+
+    def send(self, email, config):
+        message = bytes(email.message)
+        try:
+            self.get_connection(config).sendmail(
+                email.from_email, email.recipients, message
+            )
+        except smtplib.SMTPServerDisconnected:
+            # Servers close connections that stay idle for a while
+            self.close()
+            self.get_connection(config).sendmail(
+                email.from_email, email.recipients, message
+            )
+
+
+smtp_sender = SMTPSender()
+
+
+@job(unique=True)
+def send_queued_emails():
+    """
+    Sends the outbox in batches of EMAIL_BATCH_SIZE messages. Messages that
+    the server rejects are marked as failed. Any other error stops the job,
+    which is retried later with the messages that weren't sent.
+    """
+    with smtp_sender.lock:
+        config = get_smtp_config()
+        while True:
+            error = None
+            with transaction.atomic():
+                batch = list(
+                    OutgoingEmail.objects.select_for_update(skip_locked=True)
+                    .filter(failed=False)
+                    .order_by("id")[: settings.EMAIL_BATCH_SIZE]
+                )
+                if not batch:
+                    return
+
+                sent = []
+                for email in batch:
+                    try:
+                        smtp_sender.send(email, config)
+                    except Exception as exception:
+                        if not is_rejection(exception):
+                            smtp_sender.close()
+                            error = exception
+                            break
+                        OutgoingEmail.objects.filter(pk=email.pk).update(
+                            failed=True, last_error=repr(exception)
+                        )
+                    else:
+                        sent.append(email.pk)
+                OutgoingEmail.objects.filter(pk__in=sent).delete()
+
+            if error is not None:
+                raise error
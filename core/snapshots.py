@@ -0,0 +1,142 @@
+from importlib import import_module
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.wsgi import WSGIRequest
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.urls import resolve, reverse
+
+from wagtail.documents import get_document_model
+from wagtail.images import get_image_model
+from wagtail.models import Page, PageViewRestriction, Site
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from core.cache import Generation
+from core.jobs import job
+from core.models import PageSnapshot
+from core.renditions import renditions_generated
+from core.sites import site_index
+
+
+class SnapshotGeneration(Generation):
+    """
+    Snapshots taken under an older token are stale. It changes when something
+    that every snapshot may embed changes (URLs, parents' visibility, media).
+
+    Stale snapshots are only taken again by a job, so the token doesn't
+    expire. When the cache drops it anyway (culling, a restart), the new
+    token makes every snapshot stale, and the job is queued.
+    """
+
+    def get_timeout(self):
+        return None
+
+    def created(self):
+        take_stale_page_snapshots.enqueue()
+
+
+page_snapshots = SnapshotGeneration("page_snapshots")
+
+
+def build_snapshot_request(site, path):
+    """
+    Returns an anonymous GET request for the path on the site's hostname and
+    port, like the public requests that snapshots are served to.
+    """
+    scheme = "https" if site.port == 443 else "http"
+    request = WSGIRequest(
+        {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": site.hostname,
+            "SERVER_PORT": str(site.port),
+            "HTTP_HOST": "%s:%d" % (site.hostname, site.port),
+            "HTTP_ACCEPT": "application/json",
+            "wsgi.url_scheme": scheme,
+            "wsgi.input": BytesIO(),
+        }
+    )
+    request.user = AnonymousUser()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+
+    # Serialize the page even if there's a snapshot already
+    request._core_take_snapshot = True
+    return request
+
+
+def take_page_snapshots(page):
+    """
+    Stores the detail API response of the page's live revision on every site
+    that contains the page, through the pages API detail view.
+    """
+    path = reverse("wagtailapi:pages:detail", args=[page.id])
+    view, args, kwargs = resolve(path)
+
+    # Serialize in this thread, which sees the data of the current transaction
+    view = getattr(view, "sync_view", view)
+
+    for site in site_index.get().sites:
+        if page.path.startswith(site.root_paths):
+            try:
+                view(build_snapshot_request(site, path), *args, **kwargs)
+            except DisallowedHost:
+                # The site isn't served by this deployment
+                continue
+
+
+@job(unique=True)
+def take_stale_page_snapshots():
+    """
+    Takes the snapshots that are stale again. Detail requests never take
+    snapshots, they serialize the page while its snapshot is stale.
+    """
+    stale_snapshots = PageSnapshot.objects.exclude(
+        revision_id=F("page__live_revision_id"), generation=page_snapshots.get()
+    )
+    page_ids = set(stale_snapshots.values_list("page_id", flat=True))
+    stale_snapshots.delete()
+
+    pages = Page.objects.live().filter(id__in=page_ids).only("id", "path")
+    for page in pages.order_by("path").iterator():
+        take_page_snapshots(page)
+
+
+def mark_child_snapshots_stale(page):
+    # The children embed the page's title in their parent field
+    PageSnapshot.objects.filter(
+        page__path__startswith=page.path, page__depth=page.depth + 1
+    ).update(generation="")
+    take_stale_page_snapshots.enqueue()
+
+
+@receiver(page_published)
+def take_snapshots_on_publish(sender, instance, **kwargs):
+    mark_child_snapshots_stale(instance)
+    take_page_snapshots(instance)
+
+
+@receiver(page_unpublished)
+def delete_snapshots_on_unpublish(sender, instance, **kwargs):
+    PageSnapshot.objects.filter(page_id=instance.id).delete()
+    mark_child_snapshots_stale(instance)
+
+
+@receiver(post_page_move)
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+@receiver(post_save, sender=PageViewRestriction)
+@receiver(post_delete, sender=PageViewRestriction)
+@receiver(m2m_changed, sender=PageViewRestriction.groups.through)
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+@receiver(post_save, sender=get_document_model())
+@receiver(post_delete, sender=get_document_model())
+@receiver(renditions_generated)
+def invalidate_page_snapshots(sender, **kwargs):
+    page_snapshots.invalidate()
+    take_stale_page_snapshots.enqueue()
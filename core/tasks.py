@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from wagtail.images import get_image_model
+
+from core.jobs import job
+from core.renditions import generate_renditions
+
+
+@job(unique=True)
+def generate_image_renditions(image_id):
+    generate_renditions(image_id)
+
+
+@receiver(post_save, sender=get_image_model())
+def generate_renditions_on_save(sender, instance, **kwargs):
+    generate_image_renditions.enqueue(instance.pk)
+
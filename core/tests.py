@@ -1,3 +1,1486 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import gzip
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from collections import defaultdict
+import unittest
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.images import ImageFile
+from django.core.handlers.asgi import ASGIHandler
+from django.http import HttpResponse
+from django.db import connection, connections, transaction
+from django.db.models import QuerySet
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils.http import http_date
+from django.utils import timezone
+from djangorestframework_camel_case.render import (
+    CamelCaseJSONRenderer as LibraryCamelCaseJSONRenderer,
+)
+from PIL import Image as PILImage
+from rest_framework.renderers import JSONRenderer
+from wagtail.documents import get_document_model
+from wagtail.images import get_image_model
+from wagtail import blocks
+from wagtail.coreutils import get_supported_content_language_variant
+from wagtail.models import Locale, Page, PageViewRestriction, Site
+
+from core.async_views import AsyncWagtailAPIRouter, async_read_only_view
+from core.blocks import ImageChooserBlock, collect_chooser_ids
+from core.cache import Generation, GenerationCache
+from core.compression import get_accepted_encoding
+from core.jobs import Worker, job
+from core.paginations import WagtailAPIPagination
+from core.models import (
+    EmailSettings,
+    FooterPage,
+    HomePage,
+    Job,
+    OutgoingEmail,
+    PageSnapshot,
+    ReinsurersItem,
+)
+from core import replicas
+from core.renditions import generate_renditions
+from core.renderers import CamelCaseJSONRenderer, FastJSONRenderer
+from core.views import PagesAPIViewSet
+from core.sites import build_site_index, site_index
+from core.smtp import send_queued_emails, smtp_sender
+from core.snapshots import page_snapshots, take_stale_page_snapshots
+from core.tasks import generate_image_renditions
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+# Tests run in a single process, which doesn't need the shared cache, and the
+# database cache would add its queries to the counted ones
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class PagesAPIQueryCountTests(TestCase):
+    def setUp(self):
+        # The site and restriction indexes live in the cache, which outlives
+        # the rolled back test transactions
+        cache.clear()
+
+        root_page = Site.objects.get(is_default_site=True).root_page
+        self.private_page = root_page.add_child(
+            instance=Page(title="Privado", slug="privado")
+        )
+        self.private_page.add_child(instance=Page(title="Interno", slug="interno"))
+        PageViewRestriction.objects.create(
+            page=self.private_page, restriction_type=PageViewRestriction.LOGIN
+        )
+        self.home_page = root_page.add_child(
+            instance=HomePage(title="Inicio", slug="inicio")
+        )
+        self.home_page.save_revision().publish()
+
+        # Warm up the site and restriction indexes
+        self.client.get("/api/pages/")
+
+    def get_titles(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item["title"] for item in response.json()["items"]]
+
+    def test_listing(self):
+        # One aggregate for the validators and the total count, one for the pages
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/pages/")
+
+        titles = self.get_titles(response)
+        self.assertIn("Inicio", titles)
+        self.assertNotIn("Privado", titles)
+        self.assertNotIn("Interno", titles)
+
+    def test_listing_query_count_does_not_grow_with_restrictions(self):
+        root_page = Site.objects.get(is_default_site=True).root_page
+        for index in range(5):
+            page = root_page.add_child(
+                instance=Page(title="Privado %d" % index, slug="privado-%d" % index)
+            )
+            PageViewRestriction.objects.create(
+                page=page, restriction_type=PageViewRestriction.LOGIN
+            )
+        self.client.get("/api/pages/")
+
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/pages/")
+
+        self.assertEqual(["Inicio"], [
+            title for title in self.get_titles(response) if title != root_page.title
+        ])
+
+    def get_listing_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["meta"], [query["sql"] for query in queries]
+
+    def test_count_modes(self):
+        total_count = len(self.get_titles(self.client.get("/api/pages/")))
+
+        # The validators count the pages for the pagination
+        meta, queries = self.get_listing_queries("/api/pages/?count=exact")
+        self.assertEqual(meta, {"total_count": total_count})
+        self.assertEqual(len(queries), 2)
+        self.assertIn("COUNT(", queries[0])
+
+        # Other modes never count in the validators
+        meta, queries = self.get_listing_queries("/api/pages/?count=cached")
+        self.assertEqual(meta, {"total_count": total_count})
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn("COUNT(", queries[0])
+        meta, queries = self.get_listing_queries("/api/pages/?count=cached&limit=1")
+        self.assertEqual(meta, {"total_count": total_count})
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(any("COUNT(" in query for query in queries))
+
+        # SQLite has no estimates, so they fall back to counting
+        meta, queries = self.get_listing_queries("/api/pages/?count=estimate")
+        self.assertEqual(meta, {"total_count": total_count})
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn("COUNT(", queries[0])
+
+        meta, queries = self.get_listing_queries("/api/pages/?count=none&limit=1")
+        self.assertEqual(meta, {"has_next": True})
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(any("COUNT(" in query for query in queries))
+
+        response = self.client.get("/api/pages/?count=all")
+        self.assertEqual(response.status_code, 400)
+
+    def test_async_listings_are_not_streamed(self):
+        response = self.client.get("/api/pages/")
+
+        with self.settings(API_ASYNC_THREADS=2):
+            streamed_response = self.client.get("/api/pages/?stream=true")
+
+        self.assertFalse(streamed_response.streaming)
+        self.assertEqual(
+            streamed_response.json()["items"], response.json()["items"]
+        )
+
+    def test_single_type_listing_joins_page_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/pages/?type=core.HomePage")
+
+        self.assertEqual(["Inicio"], self.get_titles(response))
+        self.assertEqual(len(queries), 2)
+        for query in queries.captured_queries:
+            self.assertNotIn("IN (SELECT", query["sql"])
+
+    def test_specific_listing(self):
+        root_page = Site.objects.get(is_default_site=True).root_page
+        for index in range(5):
+            root_page.add_child(
+                instance=HomePage(
+                    title="Inicio %d" % index, slug="inicio-%d" % index, sup_title="Hola"
+                )
+            )
+            root_page.add_child(
+                instance=FooterPage(title="Pie %d" % index, slug="pie-%d" % index)
+            )
+        self.client.get("/api/pages/")
+
+        # The aggregate, the pages, one query per page type and one per inline
+        # relation (reinsurers, and both footer document columns)
+        with self.assertNumQueries(7):
+            response = self.client.get("/api/pages/?fields=*")
+
+        items = {item["title"]: item for item in response.json()["items"]}
+        self.assertEqual(items["Inicio 3"]["sup_title"], "Hola")
+        self.assertIn("footer_document_first_column", items["Pie 3"])
+        self.assertNotIn("sup_title", items[root_page.title])
+
+    def test_several_types_listing_with_specific_fields(self):
+        response = self.client.get(
+            "/api/pages/?type=core.HomePage,core.FooterPage&fields=sup_title"
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(
+            "/api/pages/?type=core.HomePage,core.FooterPage&fields=unknown"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_detail(self):
+        # The snapshot taken on publish
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/pages/%d/" % self.home_page.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["title"], "Inicio")
+
+    def test_detail_with_fields(self):
+        # The page, its specific fields, the prefetched reinsurers and the
+        # parent page for meta.parent, which is only linked if it's visible
+        with self.assertNumQueries(5):
+            response = self.client.get("/api/pages/%d/?fields=*" % self.home_page.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["title"], "Inicio")
+
+    def get_without_writes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        for query in queries.captured_queries:
+            self.assertTrue(query["sql"].startswith("SELECT"), query["sql"])
+        return response
+
+    def test_detail_snapshot_taken_again_by_job_when_stale(self):
+        url = "/api/pages/%d/" % self.home_page.id
+        self.assertEqual(PageSnapshot.objects.filter(page=self.home_page).count(), 1)
+        response = self.client.get(url, {"fields": "*"})
+
+        Site.objects.filter(is_default_site=True).update(site_name="Principal")
+        Site.objects.get(is_default_site=True).save()
+
+        # Meanwhile, requests serialize the page without storing it
+        self.assertEqual(self.get_without_writes(url).content, response.content)
+
+        self.assertTrue(
+            Job.objects.filter(name=take_stale_page_snapshots.name).exists()
+        )
+        take_stale_page_snapshots()
+        self.assertEqual(PageSnapshot.objects.filter(page=self.home_page).count(), 1)
+        with self.assertNumQueries(1):
+            snapshot_response = self.client.get(url)
+        self.assertEqual(snapshot_response.content, response.content)
+
+    def test_detail_snapshots_taken_again_when_token_is_lost(self):
+        url = "/api/pages/%d/" % self.home_page.id
+        Job.objects.all().delete()
+        # e.g. the cache was culled or restarted
+        cache.delete(page_snapshots.key)
+
+        self.assertEqual(self.client.get(url).json()["title"], "Inicio")
+        self.assertTrue(
+            Job.objects.filter(name=take_stale_page_snapshots.name).exists()
+        )
+        take_stale_page_snapshots()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).json()["title"], "Inicio")
+
+    def test_snapshot_token_does_not_expire(self):
+        page_snapshots.invalidate()
+        later = timezone.now() + datetime.timedelta(
+            seconds=settings.CACHE_GENERATION_TIMEOUT + 1
+        )
+        with mock.patch(
+            "django.core.cache.backends.locmem.time.time",
+            return_value=later.timestamp(),
+        ):
+            self.assertIsNotNone(cache.get(page_snapshots.key))
+
+    def test_missing_detail_snapshot_is_not_taken(self):
+        url = "/api/pages/%d/" % self.home_page.id
+        PageSnapshot.objects.all().delete()
+
+        response = self.get_without_writes(url)
+        self.assertEqual(response.json()["title"], "Inicio")
+        self.assertFalse(PageSnapshot.objects.exists())
+
+    def test_find(self):
+        self.client.get("/api/pages/find/?html_path=inicio")
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/pages/find/?html_path=/inicio/")
+
+        self.assertRedirects(
+            response,
+            "http://localhost/api/pages/%d/" % self.home_page.id,
+            fetch_redirect_response=False,
+        )
+
+    def test_find_restricted_page(self):
+        response = self.client.get("/api/pages/find/?html_path=privado/interno")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_find_after_slug_change(self):
+        self.client.get("/api/pages/find/?html_path=inicio")
+        self.home_page.slug = "portada"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.home_page.save()
+
+        response = self.client.get("/api/pages/find/?html_path=inicio")
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get("/api/pages/find/?html_path=portada")
+        self.assertEqual(response.status_code, 302)
+
+    def test_find_after_page_save(self):
+        self.client.get("/api/pages/find/?html_path=inicio")
+        page = Page.objects.get(pk=self.home_page.pk)
+        page.title = "Portada"
+        with CaptureQueriesContext(connection) as queries:
+            page.save()
+
+        # Neither the save nor the route lookup query the page's saved route
+        for query in queries.captured_queries:
+            self.assertNotIn('"wagtailcore_page"."live" FROM', query["sql"])
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/pages/find/?html_path=inicio")
+        self.assertEqual(response.status_code, 302)
+
+    def test_site_bundle(self):
+        self.client.get("/api/pages/bundle/")
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/pages/bundle/")
+
+        data = response.json()
+        self.assertEqual(data["home"]["title"], "Inicio")
+        self.assertIn("reinsurers_items", data["home"])
+        self.assertIsNone(data["footer"])
+
+        response = self.client.get(
+            "/api/pages/bundle/", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_site_bundle_rebuilt_on_publish(self):
+        self.client.get("/api/pages/bundle/")
+        self.home_page.title = "Portada"
+        self.home_page.save_revision().publish()
+
+        response = self.client.get("/api/pages/bundle/")
+        self.assertEqual(response.json()["home"]["title"], "Portada")
+
+    def test_compressed_detail(self):
+        url = "/api/pages/%d/" % self.home_page.id
+        response = self.client.get(url)
+
+        with self.assertNumQueries(1):
+            compressed_response = self.client.get(
+                url, HTTP_ACCEPT_ENCODING="gzip, deflate"
+            )
+
+        self.assertEqual(compressed_response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", compressed_response["Vary"])
+        self.assertEqual(gzip.decompress(compressed_response.content), response.content)
+        self.assertNotEqual(compressed_response["ETag"], response["ETag"])
+
+        response = self.client.get(
+            url,
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=compressed_response["ETag"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_compressed_site_bundle(self):
+        response = self.client.get("/api/pages/bundle/")
+        compressed_response = self.client.get(
+            "/api/pages/bundle/", HTTP_ACCEPT_ENCODING="gzip"
+        )
+
+        self.assertEqual(compressed_response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed_response.content), response.content)
+
+    def test_compressed_response_cache(self):
+        with self.settings(API_RESPONSE_CACHE_TIMEOUT=60):
+            response = self.client.get("/api/pages/")
+            with self.assertNumQueries(0):
+                compressed_response = self.client.get(
+                    "/api/pages/", HTTP_ACCEPT_ENCODING="gzip"
+                )
+
+        self.assertEqual(compressed_response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed_response.content), response.content)
+
+    def test_restricted_detail(self):
+        response = self.client.get("/api/pages/%d/" % self.private_page.id)
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCAL_CACHES, API_RESPONSE_CACHE_TIMEOUT=60)
+class PagesAPIResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        root_page = Site.objects.get(is_default_site=True).root_page
+        self.home_page = root_page.add_child(
+            instance=HomePage(title="Inicio", slug="inicio")
+        )
+        self.home_page.save_revision().publish()
+        private_page = root_page.add_child(
+            instance=Page(title="Privado", slug="privado")
+        )
+        PageViewRestriction.objects.create(
+            page=private_page, restriction_type=PageViewRestriction.LOGIN
+        )
+        other_root_page = Page.objects.get(depth=1).add_child(
+            instance=Page(title="Otro sitio", slug="otro-sitio")
+        )
+        Site.objects.create(hostname="otro.test", root_page=other_root_page)
+
+    def get(self, url, **extra):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **extra)
+        response.queries = len(queries)
+        return response
+
+    def get_titles(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item["title"] for item in response.json()["items"]]
+
+    def test_equivalent_queries_share_the_response(self):
+        response = self.get("/api/pages/?limit=5&offset=0&fields=title")
+        self.assertGreater(response.queries, 0)
+
+        # Parameter order and ignored parameters don't matter
+        cached_response = self.get("/api/pages/?fields=title&offset=0&limit=5&_=1")
+        self.assertEqual(cached_response.queries, 0)
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response["ETag"], response["ETag"])
+
+        other_response = self.get("/api/pages/?fields=title&offset=0&limit=1")
+        self.assertGreater(other_response.queries, 0)
+        self.assertEqual(len(self.get_titles(other_response)), 1)
+
+    def test_sites_do_not_share_responses(self):
+        self.assertIn("Inicio", self.get_titles(self.get("/api/pages/")))
+
+        response = self.get("/api/pages/", HTTP_HOST="otro.test")
+        self.assertGreater(response.queries, 0)
+        self.assertEqual(self.get_titles(response), ["Otro sitio"])
+
+    def test_restricted_pages_do_not_share_responses(self):
+        self.assertNotIn("Privado", self.get_titles(self.get("/api/pages/")))
+
+        user = get_user_model().objects.create_user("editor", password="clave")
+        self.client.force_login(user)
+        response = self.get("/api/pages/")
+        self.assertGreater(response.queries, 0)
+        self.assertIn("Privado", self.get_titles(response))
+
+        self.client.logout()
+        self.assertNotIn("Privado", self.get_titles(self.get("/api/pages/")))
+
+    def test_browsable_api_is_not_cached(self):
+        for username in ["ana", "beto"]:
+            user = get_user_model().objects.create_user(username, password="clave")
+            self.client.force_login(user)
+            response = self.get("/api/pages/?format=api")
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(response.queries, 0)
+            self.assertContains(response, username)
+
+        self.assertNotContains(response, "ana")
+
+    def test_errors_are_not_cached(self):
+        for url in ["/api/pages/?limit=muchos", "/api/pages/0/?fields=title"]:
+            with self.subTest(url=url):
+                status_code = self.get(url).status_code
+                self.assertIn(status_code, [400, 404])
+
+                response = self.get(url)
+                self.assertEqual(response.status_code, status_code)
+                self.assertGreater(response.queries, 0)
+
+    def test_publishing_invalidates_responses(self):
+        response = self.get("/api/pages/")
+        self.assertEqual(self.get("/api/pages/").queries, 0)
+
+        self.home_page.title = "Portada"
+        self.home_page.save_revision().publish()
+
+        new_response = self.get("/api/pages/")
+        self.assertGreater(new_response.queries, 0)
+        self.assertIn("Portada", self.get_titles(new_response))
+        self.assertNotEqual(new_response["ETag"], response["ETag"])
+
+    def test_not_modified(self):
+        response = self.get("/api/pages/")
+
+        not_modified = self.get("/api/pages/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.queries, 0)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+
+        self.home_page.save_revision().publish()
+        response = self.get("/api/pages/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_listings_are_not_validated_by_modification_time(self):
+        old_page = Page.objects.get(slug="privado")
+        PageViewRestriction.objects.all().delete()
+        old_page.save_revision().publish()
+        self.home_page.save_revision().publish()
+        old_page.unpublish()
+
+        for timeout in [60, None]:
+            with self.subTest(timeout=timeout), self.settings(
+                API_RESPONSE_CACHE_TIMEOUT=timeout
+            ):
+                response = self.get(
+                    "/api/pages/", HTTP_IF_MODIFIED_SINCE=http_date(time.time())
+                )
+                self.assertNotIn("Last-Modified", response)
+                self.assertNotIn("Privado", self.get_titles(response))
+
+        response = self.get("/api/pages/%d/" % self.home_page.id)
+        not_modified = self.get(
+            "/api/pages/%d/" % self.home_page.id,
+            HTTP_IF_MODIFIED_SINCE=response["Last-Modified"],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    @override_settings(API_RESPONSE_CACHE_TIMEOUT=None)
+    def test_not_modified_without_response_cache(self):
+        response = self.get("/api/pages/?fields=title")
+
+        # Only the validators are computed
+        not_modified = self.get(
+            "/api/pages/?fields=title", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.queries, 1)
+
+        self.assertEqual(
+            self.get("/api/pages/?fields=title&limit=1").status_code, 200
+        )
+        response = self.get(
+            "/api/pages/?fields=title&limit=1", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class PagesAPICursorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        root_page = Site.objects.get(is_default_site=True).root_page
+        self.pages = [
+            root_page.add_child(
+                instance=Page(title="Página %d" % index, slug="pagina-%d" % index)
+            )
+            for index in range(5)
+        ]
+        # Only some of the pages have been published
+        for page in self.pages[:3]:
+            page.save_revision().publish()
+            page.refresh_from_db()
+        self.children = "child_of=%d" % root_page.id
+
+    def get_all_pages(self, query):
+        titles = []
+        url = "/api/pages/?cursor=&" + query
+        while True:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            titles.extend(item["title"] for item in data["items"])
+            if data["meta"]["next"] is None:
+                return titles
+            url = "/api/pages/?cursor=%s&%s" % (data["meta"]["next"], query)
+
+    def test_cursor_round_trip(self):
+        paginator = WagtailAPIPagination()
+        field = Page._meta.get_field("first_published_at")
+        published_at = self.pages[0].first_published_at
+
+        cursor = paginator.encode_cursor(
+            "-first_published_at", field.value_to_string(self.pages[0]), 7
+        )
+        self.assertEqual(
+            paginator.decode_cursor(cursor, "-first_published_at", field),
+            (published_at, 7),
+        )
+
+    def test_pages_follow_each_other(self):
+        titles = [
+            item["title"]
+            for item in self.client.get("/api/pages/?order=id").json()["items"]
+        ]
+        self.assertEqual(self.get_all_pages("order=id&limit=2"), titles)
+
+    def test_last_page(self):
+        # The last page is full, but there is no page after it
+        response = self.client.get(
+            "/api/pages/?cursor=&order=-id&limit=5&" + self.children
+        )
+        self.assertEqual(response.json()["meta"], {"next": None})
+        self.assertEqual(
+            [item["title"] for item in response.json()["items"]],
+            ["Página 4", "Página 3", "Página 2", "Página 1", "Página 0"],
+        )
+
+        query = "order=-id&limit=4&" + self.children
+        response = self.client.get("/api/pages/?cursor=&" + query)
+        cursor = response.json()["meta"]["next"]
+        response = self.client.get("/api/pages/?cursor=%s&%s" % (cursor, query))
+        self.assertEqual(response.json()["meta"], {"next": None})
+        self.assertEqual(len(response.json()["items"]), 1)
+
+    def test_pages_without_ordering_value_are_left_out(self):
+        self.assertEqual(
+            self.get_all_pages("order=first_published_at&limit=2&" + self.children),
+            ["Página 0", "Página 1", "Página 2"],
+        )
+
+    def test_tampered_cursor(self):
+        response = self.client.get("/api/pages/?cursor=no-es-un-cursor")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get("/api/pages/?cursor=&order=id&limit=1")
+        cursor = response.json()["meta"]["next"]
+        response = self.client.get(
+            "/api/pages/?cursor=%s&order=first_published_at" % cursor
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_validators_skip_the_listing_query(self):
+        self.client.get("/api/pages/?cursor=&order=id&limit=2")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/pages/?cursor=&order=id&limit=2")
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("MAX(", queries[0]["sql"])
+
+        response = self.client.get(
+            "/api/pages/?cursor=&order=id&limit=2",
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+        self.pages[4].save_revision().publish()
+        response = self.client.get(
+            "/api/pages/?cursor=&order=id&limit=2",
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class PagesAPIStreamingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+        root_page = Site.objects.get(is_default_site=True).root_page
+        for index in range(5):
+            root_page.add_child(
+                instance=HomePage(
+                    title="Inicio %d" % index, slug="inicio-%d" % index, sup_title="Hola"
+                )
+            )
+        self.children = "child_of=%d" % root_page.id
+
+    def assertStreamsListing(self, query):
+        response = self.client.get("/api/pages/?" + query)
+        self.assertEqual(response.status_code, 200)
+
+        # Small chunks, so the listing spans several of them
+        with mock.patch.object(PagesAPIViewSet, "stream_chunk_size", 2):
+            streamed_response = self.client.get("/api/pages/?stream=true&" + query)
+            self.assertTrue(streamed_response.streaming)
+            content = b"".join(streamed_response.streaming_content)
+
+        self.assertEqual(streamed_response["Content-Type"], "application/json")
+        data = json.loads(content)
+        self.assertEqual(data, response.json())
+        return data
+
+    def test_streamed_listing(self):
+        data = self.assertStreamsListing(self.children)
+        self.assertEqual(data["meta"]["total_count"], 5)
+
+    def test_streamed_specific_listing(self):
+        data = self.assertStreamsListing("fields=*&" + self.children)
+        self.assertEqual(data["items"][0]["sup_title"], "Hola")
+
+    def test_streamed_listing_without_count(self):
+        data = self.assertStreamsListing("count=none&limit=3&" + self.children)
+        self.assertEqual(data["meta"], {"has_next": True})
+        self.assertEqual(len(data["items"]), 3)
+
+    def test_streamed_cursor_listing(self):
+        data = self.assertStreamsListing("cursor=&limit=3&" + self.children)
+        self.assertIsNotNone(data["meta"]["next"])
+        self.assertEqual(len(data["items"]), 3)
+
+        data = self.assertStreamsListing(
+            "cursor=%s&limit=3&%s" % (data["meta"]["next"], self.children)
+        )
+        self.assertEqual(data["meta"], {"next": None})
+        self.assertEqual(len(data["items"]), 2)
+
+    def test_streamed_pages_are_loaded_by_chunk(self):
+        for query in ["limit=3", "count=none&limit=3", "cursor=&limit=3"]:
+            with self.subTest(query=query), mock.patch.object(
+                PagesAPIViewSet,
+                "iter_page_chunks",
+                autospec=True,
+                side_effect=PagesAPIViewSet.iter_page_chunks,
+            ) as iter_page_chunks:
+                self.assertStreamsListing(query + "&" + self.children)
+
+                # Only the keys of the pages are loaded up front
+                view, pages = iter_page_chunks.call_args[0]
+                self.assertIsInstance(pages, QuerySet)
+
+    @override_settings(DATABASE_REPLICAS=["replica"])
+    def test_streamed_chunks_may_read_from_replicas(self):
+        flags = []
+        serialize_pages = PagesAPIViewSet.serialize_pages
+
+        def record_flag(view, *args):
+            flags.append(replicas.use_replicas.get())
+            return serialize_pages(view, *args)
+
+        with mock.patch.object(PagesAPIViewSet, "serialize_pages", record_flag):
+            self.assertStreamsListing(self.children)
+
+        # The regular listing, then every chunk of the streamed one
+        self.assertEqual(flags, [True] * 4)
+
+    def test_streamed_empty_listing(self):
+        data = self.assertStreamsListing("type=core.FooterPage")
+        self.assertEqual(data["items"], [])
+
+        data = self.assertStreamsListing("type=core.FooterPage&count=none")
+        self.assertEqual(data, {"meta": {"has_next": False}, "items": []})
+
+
+@override_settings(CACHES=LOCAL_CACHES, WAGTAIL_I18N_ENABLED=True)
+class SiteIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root_page = Site.objects.get(is_default_site=True).root_page
+
+    def test_root_page_translations_are_indexed(self):
+        # Another process, which has built the index, while this one hasn't
+        other_index = GenerationCache("sites", build_site_index)
+        self.assertEqual(other_index.get().sites[0].root_paths, (self.root_page.path,))
+
+        with mock.patch.object(site_index, "_value", None):
+            locale = Locale.objects.create(language_code="en")
+            translation = self.root_page.copy_for_translation(locale)
+        self.assertEqual(
+            other_index.get().sites[0].root_paths,
+            (self.root_page.path, translation.path),
+        )
+
+        translation.delete()
+        self.assertEqual(other_index.get().sites[0].root_paths, (self.root_page.path,))
+
+    def test_other_pages_do_not_invalidate_the_index(self):
+        site_index.get()
+        page = self.root_page.add_child(instance=Page(title="Hoja", slug="hoja"))
+        page.title = "Otra hoja"
+        page.save()
+        self.root_page.save()
+        page.delete()
+
+        # Still the index built by this process
+        with self.assertNumQueries(0):
+            site_index.get()
+
+
+class GenerationCacheTests(TestCase):
+    # Uses the database cache of the settings, which processes share
+
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return self.builds
+
+    def test_invalidation_reaches_other_processes(self):
+        # Two caches with the same name stand for two processes
+        web = GenerationCache("test", self.build)
+        worker = GenerationCache("test", self.build)
+        self.assertEqual(web.get(), 1)
+        self.assertEqual(web.get(), 1)
+
+        worker.invalidate()
+        self.assertEqual(web.get(), 2)
+
+    def test_generations_expire(self):
+        values = GenerationCache("test", self.build)
+        with override_settings(CACHE_GENERATION_TIMEOUT=1):
+            self.assertEqual(values.get(), 1)
+        later = timezone.now() + datetime.timedelta(seconds=2)
+        with mock.patch("django.core.cache.backends.db.timezone.now", return_value=later):
+            self.assertEqual(values.get(), 2)
+
+
+@override_settings(CACHE_GENERATION_CHECK_INTERVAL=1)
+class GenerationCheckIntervalTests(TransactionTestCase):
+    """
+    Reads the database cache of the settings outside a transaction, like
+    requests do.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_token_is_reused_between_checks(self):
+        # Two generations with the same name stand for two processes
+        web = Generation("test")
+        worker = Generation("test")
+        generation = web.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(web.get(), generation)
+
+        worker.invalidate()
+        self.assertNotEqual(worker.get(), generation)
+        with self.assertNumQueries(0):
+            self.assertEqual(web.get(), generation)
+
+        later = time.monotonic() + 2
+        with mock.patch("core.cache.time.monotonic", return_value=later):
+            self.assertEqual(web.get(), worker.get())
+
+    def test_token_is_read_in_transactions(self):
+        web = Generation("test")
+        generation = web.get()
+
+        with transaction.atomic():
+            with self.assertNumQueries(1):
+                self.assertEqual(web.get(), generation)
+            web.invalidate()
+            new_generation = web.get()
+            self.assertNotEqual(new_generation, generation)
+            transaction.set_rollback(True)
+
+        # The rolled back token was never reused
+        self.assertEqual(web.get(), generation)
+
+
+class CamelCaseJSONRendererTests(SimpleTestCase):
+    data = {
+        "items": [
+            {
+                "first_published_at": datetime.datetime(
+                    2023, 5, 8, 15, 8, tzinfo=datetime.timezone.utc
+                ),
+                "reinsurers_items": [{"is_active": True, "image": None}],
+                "footer_links": ({"type": "link", "value": {"open_in_new_tab": 1.5}},),
+                "line_separator": "\u2028",
+                "_private": {"a_1": "b_2", 3: "c"},
+            }
+        ],
+    }
+
+    def test_same_output_as_library(self):
+        expected = LibraryCamelCaseJSONRenderer().render(self.data)
+
+        self.assertEqual(
+            json.loads(CamelCaseJSONRenderer().render(self.data)), json.loads(expected)
+        )
+        with mock.patch("core.renderers.orjson", None):
+            self.assertEqual(CamelCaseJSONRenderer().render(self.data), expected)
+
+    def test_ignored_fields_and_keys(self):
+        options = {"ignore_fields": ["reinsurers_items"], "ignore_keys": ["footer_links"]}
+        with mock.patch.object(
+            LibraryCamelCaseJSONRenderer, "json_underscoreize", options
+        ), mock.patch.object(CamelCaseJSONRenderer, "json_underscoreize", options):
+            expected = LibraryCamelCaseJSONRenderer().render(self.data)
+            with mock.patch("core.renderers.orjson", None):
+                self.assertEqual(CamelCaseJSONRenderer().render(self.data), expected)
+
+    def test_indent(self):
+        expected = LibraryCamelCaseJSONRenderer().render(
+            self.data, "application/json; indent=4"
+        )
+
+        self.assertEqual(
+            CamelCaseJSONRenderer().render(self.data, "application/json; indent=4"),
+            expected,
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class APIRendererTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        file = BytesIO()
+        PILImage.new("RGB", (30, 15), "red").save(file, "PNG")
+        image = get_image_model().objects.create(
+            title="Logo", file=ImageFile(file, name="logo.png")
+        )
+        get_document_model().objects.create(
+            title="Póliza", file=ContentFile(b"poliza", name="poliza.pdf")
+        )
+        root_page = Site.objects.get(is_default_site=True).root_page
+        self.home_page = root_page.add_child(
+            instance=HomePage(
+                title="Inicio",
+                slug="inicio",
+                sup_title="Línea\u2028nueva",
+                banner=image,
+                payment_methods=[("logo", {"logo": image})],
+            )
+        )
+        self.home_page.save_revision().publish()
+
+    def test_same_output_as_json_renderer(self):
+        urls = [
+            "/api/pages/?fields=*",
+            "/api/pages/%d/?fields=*" % self.home_page.id,
+            "/api/images/",
+            "/api/documents/",
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+                # There are no floats in the responses, so even orjson's output
+                # is the same byte for byte
+                self.assertEqual(
+                    response.content,
+                    JSONRenderer().render(
+                        response.data, "application/json", {"indent": 4}
+                    ),
+                )
+
+
+class AcceptedEncodingTests(SimpleTestCase):
+    def get_accepted_encoding(self, accept_encoding):
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return get_accepted_encoding(request, ["br", "gzip"])
+
+    def test_accepted_encoding(self):
+        self.assertEqual(self.get_accepted_encoding("gzip, deflate, br"), "br")
+        self.assertEqual(self.get_accepted_encoding("br;q=0.5, gzip"), "gzip")
+        self.assertEqual(self.get_accepted_encoding("GZIP"), "gzip")
+        self.assertEqual(self.get_accepted_encoding("*"), "br")
+        self.assertEqual(self.get_accepted_encoding("*;q=0, gzip;q=0.1"), "gzip")
+        self.assertIsNone(self.get_accepted_encoding("deflate"))
+        self.assertIsNone(self.get_accepted_encoding("gzip;q=0"))
+        self.assertIsNone(self.get_accepted_encoding(""))
+
+
+class AsyncReadOnlyViewTests(SimpleTestCase):
+    def test_view_runs_in_the_pool(self):
+        def view(request):
+            response = HttpResponse(b"uno", status=202)
+            response["X-Thread"] = threading.current_thread().name
+            return response
+
+        async_view = async_read_only_view(view)
+        with self.settings(API_ASYNC_THREADS=2):
+            response = asyncio.run(async_view(RequestFactory().get("/")))
+
+        self.assertEqual(response.content, b"uno")
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response["X-Thread"].startswith("api"))
+        self.assertIs(async_view.sync_view, view)
+
+    def test_router_keeps_async_views_async(self):
+        router = AsyncWagtailAPIRouter("wagtailapi")
+        wrapped = router.wrap_view(async_read_only_view(lambda request: None))
+
+        self.assertTrue(asyncio.iscoroutinefunction(wrapped))
+        self.assertFalse(asyncio.iscoroutinefunction(wrapped.sync_view))
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica"], REPLICA_LAG_SECONDS=5, CACHES=LOCAL_CACHES
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    # stick_to_primary asks the connection whether it's in a transaction
+    databases = {"default"}
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(replicas, "_primary_until", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_read_database(self, method, path, user=None):
+        def get_response(request):
+            return HttpResponse(replicas.ReplicaRouter().db_for_read(Page))
+
+        request = RequestFactory().generic(method, path)
+        request.user = user or AnonymousUser()
+        return replicas.ReplicaMiddleware(get_response)(request).content.decode()
+
+    def test_anonymous_reads(self):
+        self.assertEqual(self.get_read_database("GET", "/api/pages/"), "replica")
+        self.assertEqual(self.get_read_database("HEAD", "/search/"), "replica")
+        self.assertEqual(self.get_read_database("POST", "/api/pages/"), "default")
+        self.assertEqual(self.get_read_database("GET", "/admin/pages/"), "default")
+        self.assertEqual(
+            self.get_read_database("GET", "/api/pages/", mock.Mock(is_authenticated=True)),
+            "default",
+        )
+
+    def test_reads_stick_to_primary_after_write(self):
+        replicas.stick_to_primary()
+        self.assertEqual(self.get_read_database("GET", "/api/pages/"), "default")
+
+        with mock.patch("time.time", return_value=replicas.time.time() + 6):
+            self.assertEqual(self.get_read_database("GET", "/api/pages/"), "replica")
+
+    def test_reads_outside_requests(self):
+        self.assertEqual(replicas.ReplicaRouter().db_for_read(Page), "default")
+        self.assertEqual(replicas.ReplicaRouter().db_for_write(Page), "default")
+
+
+async def slow_view(request):
+    await asyncio.sleep(0.5)
+    return HttpResponse(str(replicas.use_replicas.get()))
+
+
+# Served by ReplicaASGITests
+urlpatterns = [path("api/lento/", slow_view)]
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica"],
+    REPLICA_LAG_SECONDS=5,
+    CACHES=LOCAL_CACHES,
+    ROOT_URLCONF=__name__,
+)
+class ReplicaASGITests(SimpleTestCase):
+    async def get(self, path):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(b"host", b"testserver")],
+            "client": ("127.0.0.1", 5000),
+            "server": ("testserver", 80),
+        }
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await ASGIHandler()(scope, receive, send)
+        return b"".join(message.get("body", b"") for message in messages)
+
+    async def test_async_views_run_concurrently(self):
+        start = time.monotonic()
+        contents = await asyncio.gather(*[self.get("/api/lento/") for i in range(4)])
+
+        # One at a time, they would take two seconds
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(contents, [b"True"] * 4)
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica"], REPLICA_LAG_SECONDS=5, CACHES=LOCAL_CACHES
+)
+class ReplicaDatabaseTests(TransactionTestCase):
+    """
+    Reads through a second SQLite database standing in for a replica, which
+    only has an empty page table. Reads inside a transaction always go to
+    the primary, so these tests don't run in one.
+    """
+
+    def setUp(self):
+        connections.databases["replica"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": ":memory:",
+        }
+        connections.ensure_defaults("replica")
+        connections.prepare_test_settings("replica")
+        with connections["replica"].schema_editor() as schema_editor:
+            schema_editor.create_model(Page)
+        self.addCleanup(self.remove_replica)
+
+        # The database is emptied after each test, so set up its own content
+        Locale.objects.get_or_create(
+            language_code=get_supported_content_language_variant(settings.LANGUAGE_CODE)
+        )
+        self.page = Page.add_root(instance=Page(title="Raíz", slug="raiz"))
+
+        patcher = mock.patch.object(replicas, "_primary_until", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.forget_writes()
+
+    def forget_writes(self):
+        cache.clear()
+        replicas._primary_until = 0
+
+    def remove_replica(self):
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.databases["replica"]
+
+    def read_page(self):
+        """
+        Returns whether an anonymous API request finds the page.
+        """
+
+        def get_response(request):
+            return HttpResponse(Page.objects.filter(pk=self.page.pk).exists())
+
+        request = RequestFactory().get("/api/pages/")
+        request.user = AnonymousUser()
+        return replicas.ReplicaMiddleware(get_response)(request).content == b"True"
+
+    def test_anonymous_reads_use_the_replica(self):
+        self.assertFalse(self.read_page())
+        self.assertTrue(Page.objects.filter(pk=self.page.pk).exists())
+
+    def test_content_writes_stick_to_primary(self):
+        self.page.title = "Portada"
+        self.page.save_revision()
+        self.assertTrue(self.read_page())
+
+        with mock.patch("time.time", return_value=replicas.time.time() + 6):
+            self.assertFalse(self.read_page())
+
+        self.forget_writes()
+        PageViewRestriction.objects.create(
+            page=self.page, restriction_type=PageViewRestriction.LOGIN
+        )
+        self.assertTrue(self.read_page())
+
+    def test_other_writes_do_not_stick(self):
+        revision = self.page.save_revision()
+        site = Site.objects.create(hostname="sitio.test", root_page=self.page)
+        self.forget_writes()
+
+        send_queued_emails.enqueue()
+        SessionStore().save()
+        PageSnapshot.objects.create(
+            page=self.page, revision=revision, site=site, generation="1"
+        )
+        self.assertFalse(self.read_page())
+
+
+@override_settings(
+    API_IMAGE_RENDITION_WIDTHS=[100, 200, 400],
+    API_IMAGE_RENDITION_FORMATS=["webp", "original"],
+    WAGTAILADMIN_BASE_URL="http://cms.test",
+    CACHES=LOCAL_CACHES,
+)
+class ImageRenditionsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.image = self.create_image("Banner")
+        root_page = Site.objects.get(is_default_site=True).root_page
+        self.home_page = root_page.add_child(
+            instance=HomePage(
+                title="Inicio",
+                slug="inicio",
+                banner=self.image,
+                payment_methods=[("logo", {"logo": self.image})],
+            )
+        )
+        self.home_page.save_revision().publish()
+
+    def create_image(self, title):
+        file = BytesIO()
+        PILImage.new("RGB", (300, 150), "red").save(file, "PNG")
+        return get_image_model().objects.create(
+            title=title, file=ImageFile(file, name="%s.png" % title.lower())
+        )
+
+    def get_home_page(self):
+        response = self.client.get("/api/pages/%d/" % self.home_page.id)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_renditions_are_generated_up_to_the_image_width(self):
+        generate_renditions(self.image.id)
+
+        self.assertEqual(
+            sorted(self.image.renditions.values_list("filter_spec", "width")),
+            [
+                ("width-100", 100),
+                ("width-100|format-webp", 100),
+                ("width-200", 200),
+                ("width-200|format-webp", 200),
+            ],
+        )
+
+    def test_api_lists_existing_renditions(self):
+        self.assertEqual(self.get_home_page()["banner"]["renditions"], [])
+
+        generate_renditions(self.image.id)
+        home_page = self.get_home_page()
+
+        banner = home_page["banner"]
+        self.assertEqual(banner["id"], self.image.id)
+        self.assertIn("download_url", banner["meta"])
+        self.assertEqual(
+            [(item["format"], item["width"]) for item in banner["renditions"]],
+            [("webp", 100), ("webp", 200), ("png", 100), ("png", 200)],
+        )
+        self.assertRegex(
+            banner["srcset"]["webp"],
+            r"^http://cms\.test/\S+\.webp 100w, http://cms\.test/\S+\.webp 200w$",
+        )
+
+        logo = home_page["payment_methods"][0]["value"]["logo"]
+        self.assertEqual(logo["renditions"], banner["renditions"])
+        self.assertEqual(logo["srcset"], banner["srcset"])
+
+    def test_rendition_queries_do_not_grow_with_images(self):
+        def count_queries():
+            cache.clear()
+            self.client.get("/api/pages/?type=core.HomePage&fields=*")
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get("/api/pages/?type=core.HomePage&fields=*")
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        ReinsurersItem.objects.create(title="Uno", image=self.create_image("Uno"))
+        queries = count_queries()
+
+        for title in ["Dos", "Tres"]:
+            image = self.create_image(title)
+            generate_renditions(image.id)
+            ReinsurersItem.objects.create(title=title, image=image)
+
+        self.assertEqual(count_queries(), queries)
+
+    def test_only_serialized_stream_fields_are_prefetched(self):
+        def get_image_queries(fields):
+            self.client.get("/api/pages/?type=core.HomePage&fields=" + fields)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    "/api/pages/?type=core.HomePage&fields=" + fields
+                )
+            self.assertEqual(response.status_code, 200)
+            return [
+                query["sql"]
+                for query in queries.captured_queries
+                if "wagtailimages_" in query["sql"]
+            ]
+
+        self.assertEqual(get_image_queries("title"), [])
+        # The images, and their renditions
+        self.assertEqual(len(get_image_queries("payment_methods")), 2)
+
+    def test_only_prefetching_chooser_blocks_are_collected(self):
+        block = blocks.StructBlock(
+            [
+                ("logo", ImageChooserBlock()),
+                ("page", blocks.PageChooserBlock()),
+            ]
+        )
+        ids = defaultdict(set)
+        collect_chooser_ids(block, {"logo": self.image.id, "page": 1}, ids)
+
+        self.assertEqual(ids, {get_image_model(): {self.image.id}})
+
+
+job_calls = []
+
+
+@job(unique=True)
+def record_call(value):
+    job_calls.append(value)
+
+
+@job(max_attempts=2)
+def fail_call(value):
+    job_calls.append(value)
+    raise ValueError(value)
+
+
+@override_settings(JOBS_RETRY_DELAY=10, JOBS_LOCK_TIMEOUT=600)
+class JobTests(TestCase):
+    def setUp(self):
+        job_calls.clear()
+
+    def test_jobs_run_once_queued_and_are_deleted(self):
+        record_call.enqueue("a")
+        self.assertIsNone(record_call.enqueue("a"))
+        record_call.enqueue("b")
+
+        self.assertEqual(Worker().run_pending(), 2)
+        self.assertEqual(job_calls, ["a", "b"])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_jobs_are_retried_later(self):
+        queued = fail_call.enqueue("x")
+
+        with self.assertLogs("core.jobs", "WARNING"):
+            Worker().run_pending()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.QUEUED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn("ValueError: x", queued.last_error)
+        # Not due yet
+        self.assertEqual(Worker().run_pending(), 0)
+
+        Job.objects.update(run_at=queued.created_at)
+        with self.assertLogs("core.jobs", "ERROR"):
+            Worker().run_pending()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+        self.assertEqual(job_calls, ["x", "x"])
+
+    def test_abandoned_jobs_are_claimed_again(self):
+        queued = record_call.enqueue("a")
+        claimed = Worker().claim()
+        self.assertEqual(claimed.pk, queued.pk)
+        self.assertIsNone(Worker().claim())
+
+        Job.objects.update(locked_at=claimed.locked_at - datetime.timedelta(hours=1))
+        self.assertEqual(Worker().run_pending(), 1)
+        self.assertEqual(job_calls, ["a"])
+
+    def test_saving_an_image_queues_its_renditions(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        file = BytesIO()
+        PILImage.new("RGB", (300, 150), "red").save(file, "PNG")
+
+        with override_settings(MEDIA_ROOT=media_root):
+            image = get_image_model().objects.create(
+                title="Logo", file=ImageFile(file, name="logo.png")
+            )
+            image.save()
+            self.assertEqual(
+                Job.objects.filter(name=generate_image_renditions.name).count(), 1
+            )
+            self.assertFalse(image.renditions.exists())
+
+            Worker().run_pending()
+            self.assertTrue(image.renditions.exists())
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        # The client port tells the connections apart
+        self.messages.append((session.peer, envelope.rcpt_tos))
+        return "250 OK"
+
+
+@unittest.skipUnless(Controller, "aiosmtpd is not installed")
+@override_settings(EMAIL_BATCH_SIZE=2, DEFAULT_FROM_EMAIL="cms@backend.com")
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.addCleanup(smtp_sender.close)
+        self.handler = RecordingHandler()
+        self.port = self.start_server(self.handler)
+        self.set_smtp_port(self.port)
+
+    def start_server(self, handler):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        controller = Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        return port
+
+    def set_smtp_port(self, port):
+        config = EmailSettings.load()
+        config.email_host = "127.0.0.1"
+        config.email_port = port
+        config.email_from = "cms@backend.com"
+        config.save()
+
+    def send(self, *recipients):
+        connection = mail.get_connection("core.smtp.EmailBackend")
+        return connection.send_messages(
+            [
+                mail.EmailMessage("Hola", "Contenido", to=[recipient])
+                for recipient in recipients
+            ]
+        )
+
+    def test_messages_are_sent_in_the_background(self):
+        self.assertEqual(self.send("a@example.com", "b@example.com"), 2)
+        self.assertEqual(OutgoingEmail.objects.count(), 2)
+        self.assertEqual(self.handler.messages, [])
+
+        Worker().run_pending()
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertEqual(
+            [recipients for peer, recipients in self.handler.messages],
+            [["a@example.com"], ["b@example.com"]],
+        )
+
+    def test_connection_is_reused_until_settings_change(self):
+        self.send("a@example.com", "b@example.com", "c@example.com")
+        Worker().run_pending()
+        self.send("d@example.com")
+        Worker().run_pending()
+
+        self.assertEqual(len(self.handler.messages), 4)
+        self.assertEqual(len({peer for peer, recipients in self.handler.messages}), 1)
+
+        other_handler = RecordingHandler()
+        self.set_smtp_port(self.start_server(other_handler))
+        self.send("e@example.com")
+        Worker().run_pending()
+        self.assertEqual(len(self.handler.messages), 4)
+        self.assertEqual(len(other_handler.messages), 1)
+
+    def test_messages_wait_while_the_server_is_down(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            closed_port = sock.getsockname()[1]
+        self.set_smtp_port(closed_port)
+        self.send("a@example.com")
+
+        with self.assertLogs("core.jobs", "WARNING"):
+            Worker().run_pending()
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+        self.set_smtp_port(self.port)
+        Job.objects.update(run_at=OutgoingEmail.objects.get().created_at)
+        Worker().run_pending()
+        self.assertFalse(OutgoingEmail.objects.exists())
+        self.assertEqual(len(self.handler.messages), 1)
@@ -1,11 +1,40 @@
+import calendar
+import hashlib
+import json
+from collections import OrderedDict, defaultdict
+
 from django.conf import settings
-from django.http import Http404
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import (
+    Count,
+    F,
+    Max,
+    Prefetch,
+    QuerySet,
+    prefetch_related_objects,
+)
+from django.http import StreamingHttpResponse
 from django.urls import path
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from modelcluster.fields import ParentalKey
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 
-from wagtail.api.v2.utils import BadRequestError, page_models_from_string
+from wagtail.api.v2.utils import (
+    BadRequestError,
+    page_models_from_string,
+    parse_fields_parameter,
+)
 from wagtail.api.v2.serializers import PageSerializer
 from wagtail.api.v2.views import BaseAPIViewSet
-from wagtail.models import Page, PageViewRestriction, Site
+from wagtail.documents.api.v2.views import DocumentsAPIViewSet as BaseDocumentsAPIViewSet
+from wagtail.images import get_image_model
+from wagtail.images.api.v2.views import ImagesAPIViewSet as BaseImagesAPIViewSet
+from wagtail.models import Page, Site
 from wagtail.api.v2.filters import (
     AncestorOfFilter,
     ChildOfFilter,
@@ -16,14 +45,47 @@ from wagtail.api.v2.filters import (
     SearchFilter,
     TranslationOfFilter,
 )
+from core.api_cache import (
+    IGNORED_QUERY_PARAMETERS,
+    get_etag,
+    get_last_modified,
+    get_response_cache_key,
+)
+from core.async_views import AsyncAPIViewSetMixin
+from core.blocks import prefetch_chooser_blocks
+from core.bundles import SITE_BUNDLE_MODELS, get_site_bundle_cache_key
+from core.compression import (
+    compress,
+    encoded_response,
+    get_accepted_encoding,
+    get_encoded_etag,
+    get_encodings,
+)
+from core.models import PageSnapshot
 from core.paginations import WagtailAPIPagination
+from core.renderers import FastJSONRenderer
+from core.renditions import get_renditions_prefetch
+from core.replicas import use_replicas
+from core.restrictions import (
+    exclude_restricted_paths,
+    get_public_restricted_paths,
+    get_restricted_paths,
+)
+from core.routes import find_route
+from core.sites import find_site, find_site_for_request, site_pages_q
+from core.snapshots import page_snapshots
+
 
+# The API keeps Wagtail's snake_case output, with a faster JSON renderer
+API_RENDERER_CLASSES = [FastJSONRenderer, BrowsableAPIRenderer]
 
-class PagesAPIViewSet(BaseAPIViewSet):
+
+class PagesAPIViewSet(AsyncAPIViewSetMixin, BaseAPIViewSet):
     """
     Our custom Pages API endpoint that allows finding pages by pk or slug
     """
 
+    renderer_classes = API_RENDERER_CLASSES
     pagination_class = WagtailAPIPagination
     base_serializer_class = PageSerializer
     filter_backends = [
@@ -45,6 +107,9 @@ class PagesAPIViewSet(BaseAPIViewSet):
             "translation_of",
             "locale",
             "site",
+            "cursor",
+            "count",
+            "stream",
         ]
     )
     body_fields = BaseAPIViewSet.body_fields + [
@@ -73,12 +138,543 @@ class PagesAPIViewSet(BaseAPIViewSet):
     name = "pages"
     model = Page
 
+    # Number of pages serialized at a time by streamed listings
+    stream_chunk_size = 100
+
+    def is_cacheable(self):
+        """
+        Random orderings, searches and streamed listings are never cached or
+        validated.
+        """
+        request = self.request
+        return (
+            request.GET.get("order") != "random"
+            and "search" not in request.GET
+            and not self.is_streaming()
+        )
+
+    def is_streaming(self):
+        """
+        Listings are streamed when asked to with ?stream=true and rendered as
+        plain JSON (the browsable API is always rendered in one go). Async
+        views (see API_ASYNC_THREADS) can't stream, so they always respond
+        with the whole listing.
+        """
+        return (
+            not getattr(settings, "API_ASYNC_THREADS", None)
+            and self.action == "listing_view"
+            and self.request.GET.get("stream", "").lower() in ["1", "true"]
+            and self.request.accepted_renderer.format == "json"
+        )
+
+    def get_listing_last_modified(self):
+        """
+        Returns the latest modification time of the pages in the listing and,
+        when the listing reports an exact count, the number of pages, using a
+        single aggregate query.
+
+        Cursor pages skip the query, so each page costs the same to validate
+        as to fetch: the cursor is part of their ETag, and so is the page
+        content generation, which changes whenever the live pages do.
+        """
+        request = self.request
+        count_mode = self.paginator.get_request_count_mode(request)
+        if "cursor" in request.GET:
+            return None, None
+
+        queryset = self.filter_queryset(self.get_queryset())
+        aggregates = {
+            "last_published_at": Max("last_published_at"),
+            "latest_revision_created_at": Max("latest_revision_created_at"),
+        }
+        if count_mode == "exact":
+            aggregates["count"] = Count("id")
+        if hasattr(queryset.model, "updated_at"):
+            aggregates["updated_at"] = Max("updated_at")
+
+        result = queryset.aggregate(**aggregates)
+
+        count = result.pop("count", None)
+        if count is not None:
+            # The pagination reuses the count instead of running its own query
+            self.listing_count = count
+        return get_last_modified(result.values()), count
+
+    def get_detail_last_modified(self):
+        page = self.get_object()
+        return (
+            get_last_modified(
+                [
+                    page.last_published_at,
+                    page.latest_revision_created_at,
+                    getattr(page, "updated_at", None),
+                ]
+            ),
+            page.id,
+        )
+
+    def get_validators(self, get_last_modified):
+        """
+        Returns the ETag and the Last-Modified timestamp of the response.
+
+        Listings are only validated by their ETag: unpublishing, moving,
+        deleting or restricting a page doesn't change the latest modification
+        time of the pages left, but it changes the tag.
+        """
+        request = self.request
+        last_modified, discriminator = get_last_modified()
+        etag = get_etag(
+            request,
+            self.get_site(),
+            self.get_restricted_paths(),
+            last_modified,
+            discriminator,
+        )
+        if self.action == "listing_view":
+            last_modified = None
+        elif last_modified is not None:
+            last_modified = calendar.timegm(last_modified.utctimetuple())
+        return etag, last_modified
+
+    def get_conditional_response(self, view, get_last_modified, *args, **kwargs):
+        """
+        Answers conditional requests with a 304 before serializing anything,
+        and adds ETag and Last-Modified headers to the response.
+
+        When API_RESPONSE_CACHE_TIMEOUT is set, successful JSON responses are
+        rendered, compressed and cached together with their validators, so
+        cache hits need no queries and are served as stored. The browsable API
+        is never stored, as its pages show the user's name and CSRF token.
+        """
+        if not self.is_cacheable():
+            return view(*args, **kwargs)
+
+        request = self.request
+        timeout = getattr(settings, "API_RESPONSE_CACHE_TIMEOUT", None)
+        if timeout and request.accepted_renderer.format == "json":
+            key = get_response_cache_key(
+                request, self.get_site(), self.get_restricted_paths()
+            )
+            cached = cache.get(key)
+            if cached is None:
+                etag, last_modified = self.get_validators(get_last_modified)
+                response = view(*args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+                content = self.render_response(response)
+                cached = (
+                    content,
+                    response["Content-Type"],
+                    compress(content),
+                    etag,
+                    last_modified,
+                )
+                cache.set(key, cached, timeout)
+
+            return self.get_stored_response(*cached)
+
+        etag, last_modified = self.get_validators(get_last_modified)
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = view(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def render_response(self, response):
+        """
+        Renders a response of this view like DRF would, and returns its body.
+        """
+        request = self.request
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        return response.rendered_content
+
+    def get_stored_response(
+        self, content, content_type, variants, etag, last_modified=None
+    ):
+        """
+        Returns a stored response body in the encoding that the request accepts
+        best, or answers the conditional request.
+        """
+        encoding = get_accepted_encoding(
+            self.request, [encoding for encoding in get_encodings() if encoding in variants]
+        )
+        etag = get_encoded_etag(etag, encoding)
+
+        response = get_conditional_response(
+            self.request._request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = encoded_response(
+                content, content_type, encoding, variants.get(encoding)
+            )
+        else:
+            patch_vary_headers(response, ["Accept-Encoding"])
+
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    @classmethod
+    def get_prefetch_lookups(cls, serializer_class):
+        """
+        Returns the prefetch_related lookups needed by the relations that the
+        serializer outputs: inline (ParentalKey) children, along with the
+        foreign keys they output, and the page's own foreign keys, with the
+        renditions of the images among them.
+        """
+        model = serializer_class.Meta.model
+        lookups = []
+
+        for field_name in serializer_class.Meta.fields:
+            try:
+                field = model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                continue
+
+            if field.one_to_many and isinstance(getattr(field, "field", None), ParentalKey):
+                child_model = field.related_model
+                child_serializer_class = serializer_class.child_serializer_classes[field_name]
+                child_foreign_keys = []
+                child_renditions = []
+                for child_field_name in child_serializer_class.Meta.fields:
+                    try:
+                        child_field = child_model._meta.get_field(child_field_name)
+                    except FieldDoesNotExist:
+                        continue
+                    if child_field.many_to_one:
+                        child_foreign_keys.append(child_field_name)
+                        if issubclass(child_field.related_model, get_image_model()):
+                            child_renditions.append(get_renditions_prefetch(child_field_name))
+
+                lookups.append(
+                    Prefetch(
+                        field_name,
+                        queryset=child_model.objects.select_related(
+                            *child_foreign_keys
+                        ).prefetch_related(*child_renditions),
+                    )
+                )
+
+            elif field.many_to_one:
+                lookups.append(field_name)
+                if issubclass(field.related_model, get_image_model()):
+                    lookups.append(get_renditions_prefetch(field_name))
+
+        return lookups
+
+    def iter_page_chunks(self, pages):
+        """
+        Yields the paginated pages in chunks of stream_chunk_size, so only one
+        chunk of model instances is held in memory at a time.
+        """
+        chunk_size = self.stream_chunk_size
+
+        if isinstance(pages, QuerySet):
+            # Only load the ordered primary keys up front, then each chunk by id
+            page_ids = list(pages.values_list("pk", flat=True))
+            for start in range(0, len(page_ids), chunk_size):
+                chunk_ids = page_ids[start : start + chunk_size]
+                chunk = pages.model.objects.in_bulk(chunk_ids)
+                yield [chunk[page_id] for page_id in chunk_ids if page_id in chunk]
+
+        elif isinstance(pages, list):
+            for start in range(0, len(pages), chunk_size):
+                yield pages[start : start + chunk_size]
+
+        else:
+            # Search results can be sliced, but not filtered any further
+            start = 0
+            while True:
+                chunk = list(pages[start : start + chunk_size])
+                if not chunk:
+                    break
+                yield chunk
+                start += chunk_size
+
+    def stream_listing(self, pages, serializer_class):
+        """
+        Returns a streaming response that serializes and writes out the
+        listing chunk by chunk, so memory use doesn't grow with the limit.
+        """
+        context = self.get_serializer_context()
+        meta = self.paginator.meta
+        # The replica middleware resets the flag before the response is
+        # iterated, so the chunks read from where the listing was paged
+        can_use_replicas = use_replicas.get()
+
+        def render():
+            token = use_replicas.set(can_use_replicas)
+            try:
+                yield '{"meta": %s, "items": [' % json.dumps(meta, cls=JSONEncoder)
+                separator = ""
+                for chunk in self.iter_page_chunks(pages):
+                    data = self.serialize_pages(chunk, serializer_class, context)
+                    for item in data:
+                        yield separator + json.dumps(item, cls=JSONEncoder)
+                        separator = ", "
+                yield "]}"
+            finally:
+                use_replicas.reset(token)
+
+        return StreamingHttpResponse(render(), content_type="application/json")
+
+    def get_specific_pages(self, pages):
+        """
+        Returns the specific instances of the pages in the same order, loading
+        them with one query per page type.
+        """
+        page_ids_by_model = defaultdict(list)
+        for page in pages:
+            # specific_class comes from the content type cache, so no queries here
+            model = page.specific_class
+            if model is not None and model is not type(page):
+                page_ids_by_model[model].append(page.id)
+
+        specific_pages = {}
+        for model, page_ids in page_ids_by_model.items():
+            specific_pages.update(model.objects.in_bulk(page_ids))
+
+        return [specific_pages.get(page.id, page) for page in pages]
+
+    def serialize_pages(self, pages, serializer_class, context):
+        """
+        Returns the serialized data of the pages, prefetching the relations
+        and StreamField choosers they output.
+
+        Listings of specific fields serialize each page type with its own
+        serializer class, then put the items back in the listing order.
+        """
+        pages = list(pages)
+        if self.is_specific_listing():
+            pages = self.get_specific_pages(pages)
+            indexes_by_model = defaultdict(list)
+            for index, page in enumerate(pages):
+                indexes_by_model[type(page)].append(index)
+            groups = [
+                (self.get_specific_serializer_class(model), indexes)
+                for model, indexes in indexes_by_model.items()
+            ]
+        else:
+            groups = [(serializer_class, range(len(pages)))]
+
+        data = [None] * len(pages)
+
+        # Resolve the images and documents of the StreamFields in the pages at once
+        field_names = set()
+        for group_serializer_class, indexes in groups:
+            field_names.update(group_serializer_class.Meta.fields)
+        with prefetch_chooser_blocks(pages, field_names):
+            for group_serializer_class, indexes in groups:
+                group = [pages[index] for index in indexes]
+                prefetch_related_objects(
+                    group, *self.get_prefetch_lookups(group_serializer_class)
+                )
+                serializer = group_serializer_class(group, many=True, context=context)
+                for index, item in zip(indexes, serializer.data):
+                    data[index] = item
+
+        return data
+
+    def serialize_listing(self, request):
+        queryset = self.get_queryset()
+        self.check_query_parameters(queryset)
+        queryset = self.filter_queryset(queryset)
+        pages = self.paginate_queryset(queryset)
+
+        serializer_class = self.get_serializer_class()
+        if self.is_streaming():
+            return self.stream_listing(pages, serializer_class)
+
+        data = self.serialize_pages(
+            pages, serializer_class, self.get_serializer_context()
+        )
+        return self.get_paginated_response(data)
+
+    def serialize_detail(self, request, pk):
+        page = self.get_object()
+
+        serializer_class = self.get_serializer_class()
+        prefetch_related_objects([page], *self.get_prefetch_lookups(serializer_class))
+        serializer = serializer_class(page, context=self.get_serializer_context())
+
+        with prefetch_chooser_blocks([page], serializer_class.Meta.fields):
+            data = serializer.data
+
+        return Response(data)
+
+    def listing_view(self, request):
+        return self.get_conditional_response(
+            self.serialize_listing, self.get_listing_last_modified, request
+        )
+
+    def is_snapshot_request(self):
+        """
+        Snapshots are taken of, and served to, detail requests without query
+        parameters, rendered as plain JSON and allowed to see public pages only.
+        """
+        request = self.request
+        return (
+            set(request.GET) <= IGNORED_QUERY_PARAMETERS
+            and request.accepted_renderer.format == "json"
+            and self.get_site() is not None
+            and self.get_restricted_paths() == get_public_restricted_paths()
+        )
+
+    def get_snapshot(self, param, encoding):
+        """
+        Returns the snapshot of the page's live revision on this site, unless
+        it's stale, in a single query.
+
+        Only the content in the given encoding is loaded, the plain content is
+        loaded on access.
+        """
+        content_field = "content_%s" % encoding if encoding else "content"
+        snapshots = PageSnapshot.objects.filter(
+            page__in=self.get_queryset().filter(**{self.lookup_field: param}),
+            revision_id=F("page__live_revision_id"),
+            site_id=self.get_site().id,
+            generation=page_snapshots.get(),
+        ).only(content_field, "etag", "last_modified")[:2]
+
+        # Slugs are only unique among siblings
+        snapshots = list(snapshots)
+        if len(snapshots) == 1:
+            return snapshots[0]
+
+    def take_snapshot(self, param):
+        """
+        Serializes the page and stores the rendered response, in plain and
+        compressed forms, as the snapshot of its live revision on this site.
+        """
+        page = self.get_object()
+        if page.live_revision_id is None:
+            return
+
+        # Read the token first, so a change made while serializing marks the
+        # snapshot as stale
+        generation = page_snapshots.get()
+
+        content = self.render_response(self.serialize_detail(self.request, param))
+        variants = compress(content)
+        snapshot, created = PageSnapshot.objects.update_or_create(
+            page_id=page.id,
+            site_id=self.get_site().id,
+            defaults={
+                "revision_id": page.live_revision_id,
+                "generation": generation,
+                "content": content.decode(),
+                "content_gzip": variants.get("gzip"),
+                "content_br": variants.get("br"),
+                "etag": hashlib.sha1(content).hexdigest(),
+                "last_modified": self.get_detail_last_modified()[0],
+            },
+        )
+        return snapshot
+
+    def get_snapshot_response(self, snapshot, encoding):
+        last_modified = snapshot.last_modified
+        if last_modified is not None:
+            last_modified = calendar.timegm(last_modified.utctimetuple())
+
+        variants = {}
+        if encoding is not None:
+            encoded_content = getattr(snapshot, "content_%s" % encoding)
+            if encoded_content is not None:
+                variants[encoding] = bytes(encoded_content)
+
+        # The plain content is deferred, only load it if it's served
+        content = None if variants else snapshot.content.encode()
+        return self.get_stored_response(
+            content,
+            self.request.accepted_renderer.media_type,
+            variants,
+            '"%s"' % snapshot.etag,
+            last_modified,
+        )
+
     def detail_view(self, request, pk=None, slug=None):
         param = pk
         if slug is not None:
             self.lookup_field = "slug"
             param = slug
-        return super().detail_view(request, param)
+
+        # Public requests are served the stored response of the live revision.
+        # Snapshots are only taken on publish and by a job once stale, so when
+        # it's missing or stale the page is serialized without storing it
+        if self.is_snapshot_request():
+            encoding = get_accepted_encoding(request, get_encodings())
+            if getattr(request._request, "_core_take_snapshot", False):
+                snapshot = self.take_snapshot(param)
+            else:
+                snapshot = self.get_snapshot(param, encoding)
+            if snapshot is not None:
+                return self.get_snapshot_response(snapshot, encoding)
+
+        return self.get_conditional_response(
+            self.serialize_detail, self.get_detail_last_modified, request, param
+        )
+
+    def serialize_site_bundle(self):
+        """
+        Returns the singleton pages of the site with all their fields, or None
+        for the ones that don't exist or aren't visible.
+        """
+        router = self.request.wagtailapi_router
+        context = self.get_serializer_context()
+        data = OrderedDict()
+
+        for key, model in SITE_BUNDLE_MODELS:
+            page = self.filter_visible_pages(model.objects.all()).first()
+            if page is None:
+                data[key] = None
+                continue
+
+            serializer_class = self._get_serializer_class(
+                router, model, [], show_details=True
+            )
+            prefetch_related_objects([page], *self.get_prefetch_lookups(serializer_class))
+            with prefetch_chooser_blocks([page], serializer_class.Meta.fields):
+                data[key] = serializer_class(page, context=context).data
+
+        return data
+
+    def bundle_view(self, request):
+        """
+        Returns the home, information and footer pages in one document.
+
+        The document is rendered and compressed once and cached until one of
+        the pages is published again, so it's served without queries.
+        """
+        key = get_site_bundle_cache_key(
+            request, self.get_site(), self.get_restricted_paths()
+        )
+        cached = cache.get(key)
+        if cached is None:
+            content = json.dumps(self.serialize_site_bundle(), cls=JSONEncoder).encode()
+            cached = (content, compress(content))
+            cache.set(key, cached, settings.CACHE_GENERATION_TIMEOUT)
+
+        content, variants = cached
+        etag = '"%s"' % hashlib.sha1(content).hexdigest()
+        if request.accepted_renderer.format == "json":
+            return self.get_stored_response(content, "application/json", variants, etag)
+
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            response = Response(json.loads(content))
+        response["ETag"] = etag
+        return response
 
     @classmethod
     def get_listing_default_fields(cls, model):
@@ -98,116 +694,255 @@ class PagesAPIViewSet(BaseAPIViewSet):
         return [
             path("", cls.as_view({"get": "listing_view"}), name="listing"),
             path("<int:pk>/", cls.as_view({"get": "detail_view"}), name="detail"),
-            path("<slug:slug>/", cls.as_view({"get": "detail_view"}), name="detail"),
+            # find/ and bundle/ go before the slug pattern, which would otherwise match them
             path("find/", cls.as_view({"get": "find_view"}), name="find"),
+            path("bundle/", cls.as_view({"get": "bundle_view"}), name="bundle"),
+            path("<slug:slug>/", cls.as_view({"get": "detail_view"}), name="detail"),
         ]
 
-    def get_base_queryset(self):
+    def get_site(self):
         """
-        Returns a queryset containing all pages that can be seen by this user.
-
-        This is used as the base for get_queryset and is also used to find the
-        parent pages when using the child_of and descendant_of filters as well.
+        Returns the site the pages are listed from: the one given in the "site"
+        query parameter, or otherwise the one serving the request.
         """
+        return self.get_visibility_plan()[0]
 
-        request = self.request
-
-        # Get all live pages
-        queryset = Page.objects.all().live()
+    def get_restricted_paths(self):
+        """
+        Returns the tree paths of the restricted pages hidden from this request.
+        """
+        return self.get_visibility_plan()[1]
 
-        # Exclude pages that the user doesn't have access to
-        restricted_pages = [
-            restriction.page
-            for restriction in PageViewRestriction.objects.all().select_related("page")
-            if not restriction.accept_request(self.request)
-        ]
+    def get_visibility_plan(self):
+        """
+        Resolves the site and the restricted paths once per request; every
+        queryset, cache key and validator of the request is built from them.
+        """
+        if hasattr(self, "_visibility_plan"):
+            return self._visibility_plan
 
-        # Exclude the restricted pages and their descendants from the queryset
-        for restricted_page in restricted_pages:
-            queryset = queryset.not_descendant_of(restricted_page, inclusive=True)
+        request = self.request
 
         # Check if we have a specific site to look for
         if "site" in request.GET:
             # Optionally allow querying by port
             if ":" in request.GET["site"]:
                 (hostname, port) = request.GET["site"].split(":", 1)
-                query = {
-                    "hostname": hostname,
-                    "port": port,
-                }
             else:
-                query = {
-                    "hostname": request.GET["site"],
-                }
+                (hostname, port) = (request.GET["site"], None)
             try:
-                site = Site.objects.get(**query)
+                site = find_site(hostname, port)
             except Site.MultipleObjectsReturned:
                 raise BadRequestError(
                     "Your query returned multiple sites. Try adding a port number to your site filter."
                 )
         else:
             # Otherwise, find the site from the request
-            site = Site.find_for_request(self.request)
+            site = find_site_for_request(request)
 
-        if site:
-            base_queryset = queryset
-            queryset = base_queryset.descendant_of(site.root_page, inclusive=True)
+        self._visibility_plan = (site, get_restricted_paths(request))
+        return self._visibility_plan
+
+    def filter_visible_pages(self, queryset):
+        """
+        Filters a queryset of any page model down to the live pages of the site
+        that this user can see.
 
-            # If internationalisation is enabled, include pages from other language trees
-            if getattr(settings, "WAGTAIL_I18N_ENABLED", False):
-                for translation in site.root_page.get_translations():
-                    queryset |= base_queryset.descendant_of(translation, inclusive=True)
+        The filters only use columns of the page table, so they apply to a
+        specific page model's queryset through its parent link join.
+        """
+        site = self.get_site()
+
+        # Get all live pages
+        queryset = queryset.live()
 
+        # Exclude the pages that the user doesn't have access to, and their descendants
+        queryset = exclude_restricted_paths(queryset, self.get_restricted_paths())
+
+        if site:
+            # If internationalisation is enabled, the site root paths include
+            # the root page translations, so pages from other language trees
+            # are included as well
+            queryset = queryset.filter(site_pages_q(site))
         else:
             # No sites configured
             queryset = queryset.none()
 
         return queryset
 
+    def get_base_queryset(self):
+        """
+        Returns a queryset containing all pages that can be seen by this user.
+
+        This is used as the base for get_queryset and is also used to find the
+        parent pages when using the child_of and descendant_of filters as well.
+        """
+        if not hasattr(self, "_base_queryset"):
+            self._base_queryset = self.filter_visible_pages(Page.objects.all())
+        return self._base_queryset
+
+    def get_listing_models(self):
+        """
+        Returns the page models given in the "type" query parameter.
+        """
+        if not hasattr(self, "_listing_models"):
+            # Allow pages to be filtered to a specific type
+            try:
+                self._listing_models = page_models_from_string(
+                    self.request.GET.get("type", "wagtailcore.Page")
+                )
+            except (LookupError, ValueError):
+                raise BadRequestError("type doesn't exist")
+        return self._listing_models
+
     def get_queryset(self):
-        request = self.request
+        if hasattr(self, "_queryset"):
+            return self._queryset
 
-        # Allow pages to be filtered to a specific type
-        try:
-            models = page_models_from_string(
-                request.GET.get("type", "wagtailcore.Page")
-            )
-        except (LookupError, ValueError):
-            raise BadRequestError("type doesn't exist")
+        models = self.get_listing_models()
 
         if not models:
-            return self.get_base_queryset()
+            queryset = self.get_base_queryset()
 
         elif len(models) == 1:
             # If a single page type has been specified, swap out the Page-based queryset for one based on
             # the specific page model so that we can filter on any custom APIFields defined on that model
-            return models[0].objects.filter(
-                id__in=self.get_base_queryset().values_list("id", flat=True)
-            )
+            queryset = self.filter_visible_pages(models[0].objects.all())
 
         else:  # len(models) > 1
-            return self.get_base_queryset().type(*models)
+            queryset = self.get_base_queryset().type(*models)
+
+        self._queryset = queryset
+        return queryset
+
+    def get_fields_config(self):
+        """
+        Returns the parsed "fields" query parameter.
+        """
+        if "fields" not in self.request.GET:
+            return []
+        try:
+            return parse_fields_parameter(self.request.GET["fields"])
+        except ValueError as e:
+            raise BadRequestError("fields error: %s" % str(e))
+
+    @classmethod
+    def get_fields_names(cls, model):
+        return cls.get_body_fields_names(model) + cls.get_meta_fields_names(model)
+
+    def is_specific_listing(self):
+        """
+        Listings of all page types, or of several, output the fields of Page,
+        unless they ask for all fields ("*") or for fields of the page types.
+        Each page is then output with the fields of its own type.
+        """
+        if not hasattr(self, "_is_specific_listing"):
+            fields_config = self.get_fields_config()
+            page_fields = set(self.get_fields_names(Page))
+            self._is_specific_listing = (
+                self.action == "listing_view"
+                and self.get_queryset().model is Page
+                and any(
+                    field_name == "*" or field_name not in page_fields | {"_"}
+                    for field_name, negated, sub_fields in fields_config
+                )
+            )
+        return self._is_specific_listing
+
+    def get_specific_serializer_class(self, model):
+        """
+        Returns the serializer class of a specific page model in a specific
+        listing, leaving out the requested fields that the model doesn't have.
+        """
+        if not hasattr(self, "_specific_serializer_classes"):
+            self._specific_serializer_classes = {}
+
+        if model not in self._specific_serializer_classes:
+            fields_names = set(self.get_fields_names(model)) | {"*", "_"}
+            fields_config = [
+                field_config
+                for field_config in self.get_fields_config()
+                if field_config[0] in fields_names
+            ]
+            self._specific_serializer_classes[model] = self._get_serializer_class(
+                self.request.wagtailapi_router, model, fields_config
+            )
+        return self._specific_serializer_classes[model]
+
+    def get_serializer_class(self):
+        # Serializer classes are built dynamically, so only build it once
+        if hasattr(self, "_serializer_class"):
+            return self._serializer_class
+
+        if self.is_specific_listing():
+            # Fields must exist on at least one of the listed page types
+            fields_names = set(self.get_fields_names(Page)) | {"*", "_"}
+            for model in self.get_listing_models():
+                fields_names.update(self.get_fields_names(model))
+            unknown_fields = {
+                field_name for field_name, negated, sub_fields in self.get_fields_config()
+            } - fields_names
+            if unknown_fields:
+                raise BadRequestError(
+                    "unknown fields: %s" % ", ".join(sorted(unknown_fields))
+                )
+
+            self._serializer_class = self.get_specific_serializer_class(Page)
+        else:
+            self._serializer_class = super().get_serializer_class()
+
+        return self._serializer_class
 
     def get_object(self):
-        base = super().get_object()
-        return base.specific
+        # Detail responses look the page up for the validators, the serializer
+        # class and the serializer, so only resolve it once
+        if not hasattr(self, "_object"):
+            self._object = super().get_object().specific
+        return self._object
 
     def find_object(self, queryset, request):
-        site = Site.find_for_request(request)
+        site = find_site_for_request(request)
         if "html_path" in request.GET and site is not None:
-            path = request.GET["html_path"]
-            path_components = [component for component in path.split("/") if component]
-
-            try:
-                page, _, _ = site.root_page.specific.route(request, path_components)
-            except Http404:
+            route = find_route(site, request.GET["html_path"])
+            if route is None:
                 return
 
-            if queryset.filter(id=page.id).exists():
-                return page
+            if queryset is self.get_queryset():
+                visible = self.is_visible_route(route)
+            else:
+                visible = queryset.filter(id=route.page_id).exists()
+
+            if visible:
+                # find_view only needs the primary key to redirect to the page
+                return Page(
+                    id=route.page_id,
+                    path=route.path,
+                    content_type_id=route.content_type_id,
+                )
+            return
 
         return super().find_object(queryset, request)
 
+    def is_visible_route(self, route):
+        """
+        Checks whether get_queryset includes the routed page without a query:
+        routes only lead to live pages, so it's left to check the site, the
+        restrictions and the page type.
+        """
+        site = self.get_site()
+        if site is None or not route.path.startswith(site.root_paths):
+            return False
+
+        if route.path.startswith(self.get_restricted_paths()):
+            return False
+
+        models = self.get_listing_models()
+        if models and models != (Page,):
+            model = ContentType.objects.get_for_id(route.content_type_id).model_class()
+            return model is not None and issubclass(model, models)
+
+        return True
+
     def get_serializer_context(self):
         """
         The serialization context differs between listing and detail views.
@@ -215,3 +950,11 @@ class PagesAPIViewSet(BaseAPIViewSet):
         context = super().get_serializer_context()
         context["base_queryset"] = self.get_base_queryset()
         return context
+
+
+class ImagesAPIViewSet(AsyncAPIViewSetMixin, BaseImagesAPIViewSet):
+    renderer_classes = API_RENDERER_CLASSES
+
+
+class DocumentsAPIViewSet(AsyncAPIViewSetMixin, BaseDocumentsAPIViewSet):
+    renderer_classes = API_RENDERER_CLASSES
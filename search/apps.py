@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class SearchConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'search'
+
+    def ready(self):
+        # Connect the suggestion invalidation receivers, and register the
+        # search index jobs
+        from search import backends, suggestions  # noqa: F401
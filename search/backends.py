@@ -0,0 +1,491 @@
+import fcntl
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Model
+from django.db.models.lookups import Exact
+from django.utils.encoding import force_str
+
+from wagtail.models import Page
+from wagtail.search.backends import get_search_backend
+from wagtail.search.backends.base import (
+    BaseSearchBackend,
+    BaseSearchQueryCompiler,
+    BaseSearchResults,
+)
+from wagtail.search.index import RelatedFields, SearchField
+from wagtail.search.query import And, Boost, MatchAll, Not, Or, Phrase, PlainText
+
+from core.jobs import job
+from core.models import Job
+from search.inverted_index import InvertedIndex, tokenize
+
+
+def prepare_value(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return " ".join(prepare_value(item) for item in value)
+    if isinstance(value, dict):
+        return " ".join(prepare_value(item) for item in value.values())
+    if value is None:
+        return ""
+    return force_str(value)
+
+
+def get_search_texts(obj, fields):
+    """
+    Yields the text of every SearchField of the object, with its boost.
+    """
+    for field in fields:
+        if isinstance(field, SearchField):
+            yield prepare_value(field.get_value(obj)), field.boost or 1.0
+
+        elif isinstance(field, RelatedFields):
+            value = field.get_value(obj)
+            if value is None:
+                continue
+            if hasattr(value, "all"):
+                related_objects = value.all()
+            else:
+                related_objects = [value() if callable(value) else value]
+            for related_object in related_objects:
+                yield from get_search_texts(related_object, field.fields)
+
+
+def get_page_document(page):
+    """
+    Returns the weighted frequency of each term in the searchable fields of
+    the (specific) page.
+    """
+    document = {}
+    for text, boost in get_search_texts(page, page.get_search_fields()):
+        for term in tokenize(text):
+            document[term] = document.get(term, 0.0) + boost
+    return document
+
+
+def build_page_documents():
+    return {
+        page.id: get_page_document(page)
+        for page in Page.objects.live().specific().iterator()
+    }
+
+
+class PageIndex:
+    """
+    The inverted index of the live pages, shared by the processes of a host
+    through the file at SEARCH_INDEX_PATH.
+
+    Publishing, unpublishing or deleting a page queues a job that rewrites
+    the file with the changes queued so far and a new generation, which is
+    also stored in the cache, without expiry. Every process maps the file
+    again once it sees the new generation. If the cache loses the
+    generation, the file's own is stored again.
+
+    Requests never build the index: while the file is missing or has another
+    generation, a job is queued to rebuild it from the database, and
+    searches use the fallback backend.
+    """
+
+    cache_key = "core:generation:search_index"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    @property
+    def path(self):
+        return settings.SEARCH_INDEX_PATH
+
+    def _file_lock(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock_file = open(self.path + ".lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _load(self, generation):
+        try:
+            index = InvertedIndex.load(self.path)
+        except (OSError, ValueError):
+            return None
+        return index if index.generation == generation else None
+
+    def _save(self, documents, generation):
+        index = InvertedIndex.build(documents, generation)
+        index.save(self.path)
+        return InvertedIndex.load(self.path)
+
+    def get(self):
+        """
+        Returns the current index, loading it if needed, or None while it has
+        to be rebuilt.
+        """
+        generation = cache.get(self.cache_key)
+        index = self._index
+        if index is not None and generation is not None and index.generation == generation:
+            return index
+
+        with self._lock:
+            try:
+                index = InvertedIndex.load(self.path)
+            except (OSError, ValueError):
+                index = None
+
+            if generation is None and index is not None:
+                # The cache lost the generation, the file has the latest index
+                cache.add(self.cache_key, index.generation, None)
+                generation = cache.get(self.cache_key)
+
+            if index is None or index.generation != generation:
+                rebuild_page_index.enqueue()
+                return None
+            self._index = index
+            return index
+
+    def _rebuild(self):
+        with self._lock, self._file_lock():
+            generation = cache.get(self.cache_key)
+            if generation is not None and self._load(generation) is not None:
+                return
+
+            # Keep the current generation, which other processes may have
+            # loaded already
+            generation = generation or uuid.uuid4().hex
+            self._index = self._save(build_page_documents(), generation)
+            cache.set(self.cache_key, generation, None)
+
+    def _update(self, changes):
+        """
+        Rewrites the index with the documents of the pages in ``changes``, or
+        without the pages whose document is None.
+        """
+        with self._lock, self._file_lock():
+            index = self._load(cache.get(self.cache_key))
+            documents = index.get_documents() if index else build_page_documents()
+            if index and all(
+                documents.get(page_id) == document
+                for page_id, document in changes.items()
+            ):
+                # e.g. drafts of the pages were saved
+                self._index = index
+                return
+            for page_id, document in changes.items():
+                if document is None:
+                    documents.pop(page_id, None)
+                else:
+                    documents[page_id] = document
+
+            generation = uuid.uuid4().hex
+            self._index = self._save(documents, generation)
+            cache.set(self.cache_key, generation, None)
+
+    def update(self, page):
+        """
+        Queues the indexing of the page, or its removal if it isn't live.
+        """
+        update_page_index.enqueue(page.id)
+
+    def remove(self, page_id):
+        update_page_index.enqueue(page_id)
+
+
+page_index = PageIndex()
+
+
+@job(unique=True)
+def update_page_index(page_id):
+    """
+    Indexes the page if it's live, or drops it from the index otherwise.
+
+    The pages of the other updates waiting in the queue are indexed along
+    with it, so the index is rewritten once per run rather than per page.
+    Those jobs are only dropped if the index is saved.
+    """
+    with transaction.atomic():
+        queued = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                name=update_page_index.name, status=Job.QUEUED
+            )
+        )
+        page_ids = {page_id}
+        page_ids.update(queued_job.args[0] for queued_job in queued)
+
+        changes = dict.fromkeys(page_ids)
+        for page in Page.objects.live().filter(pk__in=page_ids).specific():
+            changes[page.pk] = get_page_document(page)
+        page_index._update(changes)
+        Job.objects.filter(pk__in=[queued_job.pk for queued_job in queued]).delete()
+
+
+@job(unique=True)
+def rebuild_page_index():
+    """
+    Builds the index from the database, unless the file is up to date.
+    """
+    page_index._rebuild()
+
+
+def is_live_queryset(queryset):
+    """
+    Returns whether the queryset only contains live pages.
+    """
+    where = queryset.query.where
+    if where.connector != "AND" or where.negated:
+        return False
+    return any(
+        isinstance(child, Exact)
+        and getattr(child.lhs, "target", None) is not None
+        and child.lhs.target.attname == "live"
+        and child.rhs is True
+        for child in where.children
+    )
+
+
+class InvertedIndexSearchQueryCompiler(BaseSearchQueryCompiler):
+    DEFAULT_OPERATOR = "and"
+
+    def _process_lookup(self, field, lookup, value):
+        # Filters are applied by the database, when the results are fetched
+        return True
+
+    def _connect_filters(self, filters, connector, negated):
+        return True
+
+    def get_terms(self, query_string):
+        return tokenize(query_string)
+
+    def score(self, index, query=None, boost=1.0):
+        """
+        Returns the score of every matching document, by its position in the
+        index.
+        """
+        if query is None:
+            query = self.query
+
+        if isinstance(query, PlainText):
+            boost *= query.boost
+            scores = [index.score_term(term) for term in self.get_terms(query.query_string)]
+            if query.operator == "or":
+                return self.combine_or(scores, boost)
+            return self.combine_and(scores, boost)
+
+        if isinstance(query, Phrase):
+            # Positions aren't indexed, so phrases match all of their terms
+            scores = [index.score_term(term) for term in self.get_terms(query.query_string)]
+            return self.combine_and(scores, boost)
+
+        if isinstance(query, Boost):
+            return self.score(index, query.subquery, boost * query.boost)
+
+        if isinstance(query, MatchAll):
+            return index.all_documents()
+
+        if isinstance(query, Not):
+            excluded = self.score(index, query.subquery, boost)
+            return {
+                doc: score
+                for doc, score in index.all_documents().items()
+                if doc not in excluded
+            }
+
+        if isinstance(query, And):
+            scores = [self.score(index, subquery) for subquery in query.subqueries]
+            return self.combine_and(scores, boost)
+
+        if isinstance(query, Or):
+            scores = [self.score(index, subquery) for subquery in query.subqueries]
+            return self.combine_or(scores, boost)
+
+        raise NotImplementedError(
+            "`%s` is not supported by the inverted index search backend."
+            % query.__class__.__name__
+        )
+
+    def combine_and(self, scores, boost):
+        if not scores:
+            return {}
+        scores = sorted(scores, key=len)
+        combined = {}
+        for doc, score in scores[0].items():
+            total = score
+            for other in scores[1:]:
+                if doc not in other:
+                    break
+                total += other[doc]
+            else:
+                combined[doc] = total * boost
+        return combined
+
+    def combine_or(self, scores, boost):
+        combined = {}
+        for term_scores in scores:
+            for doc, score in term_scores.items():
+                combined[doc] = combined.get(doc, 0.0) + score * boost
+        return combined
+
+
+class InvertedIndexAutocompleteQueryCompiler(InvertedIndexSearchQueryCompiler):
+    def score(self, index, query=None, boost=1.0):
+        if query is None:
+            query = self.query
+        if not isinstance(query, PlainText):
+            return super().score(index, query, boost)
+
+        # The last word matches every term it is a prefix of
+        *terms, prefix = self.get_terms(query.query_string) or [""]
+        scores = [index.score_term(term) for term in terms]
+        if prefix:
+            scores.append(
+                self.combine_or(
+                    [index.score_term(term) for term in index.get_prefix_terms(prefix)],
+                    1.0,
+                )
+            )
+        if query.operator == "or":
+            return self.combine_or(scores, boost * query.boost)
+        return self.combine_and(scores, boost * query.boost)
+
+
+class InvertedIndexSearchResults(BaseSearchResults):
+    def get_ranked_ids(self):
+        index = page_index.get()
+        if index is None:
+            # The index went out of date after the search started
+            return []
+        scores = self.query_compiler.score(index)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(index.doc_ids[doc], score) for doc, score in ranked]
+
+    def get_matching_ids(self):
+        """
+        Returns the ids and scores of the results that pass the filters of the
+        queryset, best first.
+        """
+        if not hasattr(self, "_matching_ids"):
+            ranked_ids = self.get_ranked_ids()
+            visible_ids = set(
+                self.query_compiler.queryset.filter(
+                    pk__in=[page_id for page_id, score in ranked_ids]
+                ).values_list("pk", flat=True)
+            )
+            self._matching_ids = [
+                (page_id, score) for page_id, score in ranked_ids if page_id in visible_ids
+            ]
+        return self._matching_ids
+
+    def _do_search(self):
+        queryset = self.query_compiler.queryset
+
+        if not self.query_compiler.order_by_relevance:
+            ids = [page_id for page_id, score in self.get_ranked_ids()]
+            return list(queryset.filter(pk__in=ids)[self.start : self.stop])
+
+        results = self.get_matching_ids()[self.start : self.stop]
+        objects = queryset.in_bulk([page_id for page_id, score in results])
+        pages = []
+        for page_id, score in results:
+            page = objects.get(page_id)
+            if page is not None:
+                if self._score_field:
+                    setattr(page, self._score_field, score)
+                pages.append(page)
+        return pages
+
+    def _do_count(self):
+        if not self.query_compiler.order_by_relevance:
+            ids = [page_id for page_id, score in self.get_ranked_ids()]
+            count = self.query_compiler.queryset.filter(pk__in=ids).count()
+        else:
+            count = len(self.get_matching_ids())
+
+        count = max(count - self.start, 0)
+        if self.stop is not None:
+            count = min(count, self.stop - self.start)
+        return count
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """
+    Searches the live pages in an in-process inverted index, with BM25
+    scores, and everything else with the FALLBACK backend.
+
+    Only the search runs in memory: the results still go through the
+    database once, to apply the filters of the queryset and fetch the pages.
+    The fallback backend is kept up to date as well, for the searches of the
+    admin, which include drafts, and of images and documents.
+    """
+
+    query_compiler_class = InvertedIndexSearchQueryCompiler
+    autocomplete_query_compiler_class = InvertedIndexAutocompleteQueryCompiler
+    results_class = InvertedIndexSearchResults
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.fallback = get_search_backend(
+            params.get("FALLBACK", "wagtail.search.backends.database")
+        )
+
+    @property
+    def rebuilder_class(self):
+        return self.fallback.rebuilder_class
+
+    def get_index_for_model(self, model):
+        return self.fallback.get_index_for_model(model)
+
+    def get_rebuilder(self):
+        return self.fallback.get_rebuilder()
+
+    def reset_index(self):
+        self.fallback.reset_index()
+
+    def add_type(self, model):
+        self.fallback.add_type(model)
+
+    def refresh_index(self):
+        self.fallback.refresh_index()
+
+    def add(self, obj):
+        self.fallback.add(obj)
+        if isinstance(obj, Page):
+            page_index.update(obj)
+
+    def add_bulk(self, model, obj_list):
+        self.fallback.add_bulk(model, obj_list)
+        if issubclass(model, Page):
+            for obj in obj_list:
+                page_index.update(obj)
+
+    def delete(self, obj):
+        self.fallback.delete(obj)
+        if isinstance(obj, Page):
+            page_index.remove(obj.pk)
+
+    def use_page_index(self, model_or_queryset, fields):
+        if isinstance(model_or_queryset, type) and issubclass(model_or_queryset, Model):
+            return False
+        return (
+            not fields
+            and issubclass(model_or_queryset.model, Page)
+            and is_live_queryset(model_or_queryset)
+            and page_index.get() is not None
+        )
+
+    def search(self, query, model_or_queryset, fields=None, **kwargs):
+        if not self.use_page_index(model_or_queryset, fields):
+            return self.fallback.search(query, model_or_queryset, fields=fields, **kwargs)
+        return super().search(query, model_or_queryset, fields=fields, **kwargs)
+
+    def autocomplete(self, query, model_or_queryset, fields=None, **kwargs):
+        if not self.use_page_index(model_or_queryset, fields):
+            return self.fallback.autocomplete(
+                query, model_or_queryset, fields=fields, **kwargs
+            )
+        return super().autocomplete(query, model_or_queryset, fields=fields, **kwargs)
+
+
+SearchBackend = InvertedIndexSearchBackend
@@ -0,0 +1,126 @@
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from wagtail.search.models import Query, QueryDailyHits
+from wagtail.search.utils import normalise_query_string
+
+from search.suggestions import query_suggestions
+
+
+logger = logging.getLogger(__name__)
+
+
+def save_hits(hits):
+    """
+    Adds the hits, a mapping of (normalised query string, date) to a count,
+    to the search query statistics in a few bulk statements.
+    """
+    query_strings = {query_string for query_string, date in hits}
+    with transaction.atomic():
+        Query.objects.bulk_create(
+            [Query(query_string=query_string) for query_string in query_strings],
+            ignore_conflicts=True,
+        )
+        query_ids = dict(
+            Query.objects.filter(query_string__in=query_strings).values_list(
+                "query_string", "id"
+            )
+        )
+
+        QueryDailyHits.objects.bulk_create(
+            [
+                QueryDailyHits(query_id=query_ids[query_string], date=date)
+                for query_string, date in hits
+            ],
+            ignore_conflicts=True,
+        )
+
+        # One update for all the queries with the same date and count
+        groups = defaultdict(list)
+        for (query_string, date), count in hits.items():
+            groups[date, count].append(query_ids[query_string])
+        for (date, count), ids in groups.items():
+            QueryDailyHits.objects.filter(query_id__in=ids, date=date).update(
+                hits=F("hits") + count
+            )
+
+    query_suggestions.invalidate()
+
+
+class HitBuffer:
+    """
+    Counts search hits in process memory and saves them in batches from a
+    background thread, every SEARCH_HITS_FLUSH_INTERVAL seconds or once
+    SEARCH_HITS_MAX_PENDING different queries are waiting.
+
+    Searches then don't write to the database, nor wait on the row locks of
+    popular queries. Hits still pending when the process dies are lost.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hits = Counter()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, query_string, date=None):
+        query_string = normalise_query_string(query_string)
+        if not query_string:
+            return
+
+        key = (query_string, date or timezone.now().date())
+        with self._lock:
+            self._hits[key] += 1
+            pending = len(self._hits)
+            if self._thread is None or not self._thread.is_alive():
+                self._start()
+
+        if pending >= settings.SEARCH_HITS_MAX_PENDING:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Saves the pending hits. They stay pending if saving them fails.
+        """
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+        if not hits:
+            return
+
+        try:
+            save_hits(hits)
+        except Exception:
+            logger.exception("No se pudieron guardar %d búsquedas", len(hits))
+            with self._lock:
+                self._hits.update(hits)
+
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="search-hits", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(settings.SEARCH_HITS_FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # This thread's connections are never closed by a request
+                connections.close_all()
+
+
+hit_buffer = HitBuffer()
+
+
+@atexit.register
+def flush_on_exit():
+    hit_buffer.flush()
@@ -0,0 +1,228 @@
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import unicodedata
+from array import array
+from collections import defaultdict
+
+
+MAGIC = b"CMSIDX01"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """
+    Returns the lowercase words of the text, without accents.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"\w+", text)
+
+
+def _pad(length):
+    return -length % 8
+
+
+class InvertedIndex:
+    """
+    An immutable inverted index of documents, identified by integer ids, for
+    BM25 ranked searches.
+
+    Terms are kept sorted, and the postings of every term are stored one after
+    the other in two flat arrays: the positions of the documents and the
+    weighted frequency of the term in each one. Saved indexes are loaded
+    through a memory map, so the processes that load the same file share its
+    pages and don't parse the postings.
+    """
+
+    def __init__(
+        self,
+        generation,
+        doc_ids,
+        doc_lengths,
+        terms,
+        term_offsets,
+        posting_docs,
+        posting_weights,
+    ):
+        self.generation = generation
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.terms = terms
+        self.term_positions = {term: position for position, term in enumerate(terms)}
+        self.term_offsets = term_offsets
+        self.posting_docs = posting_docs
+        self.posting_weights = posting_weights
+
+        self.doc_count = len(doc_ids)
+        self.average_length = (
+            sum(doc_lengths) / self.doc_count if self.doc_count else 0.0
+        )
+
+    @classmethod
+    def build(cls, documents, generation=None):
+        """
+        Builds the index of ``documents``, a mapping of document ids to the
+        weighted frequency of each term in the document.
+        """
+        doc_ids = array("q", sorted(documents))
+        doc_lengths = array(
+            "f", (sum(documents[doc_id].values()) for doc_id in doc_ids)
+        )
+
+        postings = defaultdict(list)
+        for position, doc_id in enumerate(doc_ids):
+            for term, weight in documents[doc_id].items():
+                postings[term].append((position, weight))
+
+        terms = sorted(postings)
+        term_offsets = array("I", [0])
+        posting_docs = array("I")
+        posting_weights = array("f")
+        for term in terms:
+            for position, weight in postings[term]:
+                posting_docs.append(position)
+                posting_weights.append(weight)
+            term_offsets.append(len(posting_docs))
+
+        return cls(
+            generation,
+            doc_ids,
+            doc_lengths,
+            terms,
+            term_offsets,
+            posting_docs,
+            posting_weights,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a saved index, mapping its arrays from the file.
+        """
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if buffer[: len(MAGIC)] != MAGIC:
+            raise ValueError("%s no es un índice de búsqueda" % path)
+
+        offset = len(MAGIC)
+        (header_length,) = struct.unpack_from("<I", buffer, offset)
+        offset += 4
+        header = json.loads(buffer[offset : offset + header_length])
+        offset += header_length + _pad(header_length + offset)
+
+        view = memoryview(buffer)
+        arrays = []
+        for typecode, length in header["arrays"]:
+            size = struct.calcsize(typecode) * length
+            arrays.append(view[offset : offset + size].cast(typecode))
+            offset += size + _pad(size)
+
+        doc_ids, doc_lengths, term_offsets, posting_docs, posting_weights = arrays
+        return cls(
+            header["generation"],
+            doc_ids,
+            doc_lengths,
+            header["terms"],
+            term_offsets,
+            posting_docs,
+            posting_weights,
+        )
+
+    def save(self, path):
+        """
+        Writes the index to a file that replaces ``path`` atomically.
+        """
+        arrays = [
+            self.doc_ids,
+            self.doc_lengths,
+            self.term_offsets,
+            self.posting_docs,
+            self.posting_weights,
+        ]
+        header = json.dumps(
+            {
+                "generation": self.generation,
+                "terms": self.terms,
+                "arrays": [(item.format, len(item)) for item in map(memoryview, arrays)],
+            }
+        ).encode()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+            try:
+                file.write(MAGIC)
+                file.write(struct.pack("<I", len(header)))
+                file.write(header)
+                file.write(b"\0" * _pad(len(MAGIC) + 4 + len(header)))
+                for item in arrays:
+                    data = memoryview(item).cast("B")
+                    file.write(data)
+                    file.write(b"\0" * _pad(len(data)))
+                file.flush()
+                os.fsync(file.fileno())
+            except BaseException:
+                os.unlink(file.name)
+                raise
+        os.chmod(file.name, 0o644)
+        os.replace(file.name, path)
+
+    def get_documents(self):
+        """
+        Returns the indexed documents, as they were given to ``build``.
+        """
+        documents = {doc_id: {} for doc_id in self.doc_ids}
+        for position, term in enumerate(self.terms):
+            start, end = self.term_offsets[position], self.term_offsets[position + 1]
+            for index in range(start, end):
+                doc_id = self.doc_ids[self.posting_docs[index]]
+                documents[doc_id][term] = self.posting_weights[index]
+        return documents
+
+    def get_prefix_terms(self, prefix):
+        """
+        Returns the indexed terms that start with the prefix.
+        """
+        start = bisect.bisect_left(self.terms, prefix)
+        end = start
+        while end < len(self.terms) and self.terms[end].startswith(prefix):
+            end += 1
+        return self.terms[start:end]
+
+    def all_documents(self):
+        """
+        Returns a score of 0 for every document, by position.
+        """
+        return dict.fromkeys(range(self.doc_count), 0.0)
+
+    def score_term(self, term):
+        """
+        Returns the BM25 score of the term in every document that contains it,
+        by document position.
+        """
+        position = self.term_positions.get(term)
+        if position is None:
+            return {}
+
+        start, end = self.term_offsets[position], self.term_offsets[position + 1]
+        frequency = end - start
+        idf = math.log(1 + (self.doc_count - frequency + 0.5) / (frequency + 0.5))
+
+        scores = {}
+        doc_lengths = self.doc_lengths
+        average_length = self.average_length
+        for index in range(start, end):
+            doc = self.posting_docs[index]
+            weight = self.posting_weights[index]
+            norm = K1 * (1 - B + B * doc_lengths[doc] / average_length)
+            scores[doc] = idf * weight * (K1 + 1) / (weight + norm)
+        return scores
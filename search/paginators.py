@@ -0,0 +1,116 @@
+import hashlib
+from collections.abc import Sequence
+from math import ceil
+
+from django.core.cache import cache
+
+from core.api_cache import page_content
+
+
+def get_count_cache_key(query_string):
+    return "search:count:%s:%s" % (
+        page_content.get(),
+        hashlib.sha1(query_string.encode()).hexdigest(),
+    )
+
+
+class LookaheadPage(Sequence):
+    """
+    A page of results with the interface of Django's Page that the templates
+    use for navigation.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+
+    def __repr__(self):
+        return "<Page %s>" % self.number
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return self.paginator.per_page * (self.number - 1) + 1
+
+    def end_index(self):
+        return self.paginator.per_page * (self.number - 1) + len(self.object_list)
+
+
+class LookaheadPaginator:
+    """
+    Paginates search results without counting them: each page fetches one
+    result more than it shows, to tell whether there is a next page, so the
+    search runs once per page view.
+
+    With a ``count_key``, the total count is remembered once a page reaches
+    the end of the results, until the page content changes. The count and
+    number of pages are None while it's unknown.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.count_key = count_key
+
+    @property
+    def count(self):
+        if self.count_key is None:
+            return None
+        return cache.get(self.count_key)
+
+    @property
+    def num_pages(self):
+        count = self.count
+        if count is None:
+            return None
+        return max(1, ceil(count / self.per_page))
+
+    def get_page_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            return 1
+        return max(number, 1)
+
+    def page(self, number):
+        """
+        Returns the page with the given number, or the first page if it isn't
+        a valid number. A page past the end is empty, or the last page once
+        the count is known.
+        """
+        number = self.get_page_number(number)
+        num_pages = self.num_pages
+        if num_pages is not None:
+            number = min(number, num_pages)
+
+        offset = (number - 1) * self.per_page
+        results = list(self.object_list[offset : offset + self.per_page + 1])
+        has_next = len(results) > self.per_page
+
+        if not has_next and self.count_key is not None and (results or offset == 0):
+            cache.set(self.count_key, offset + len(results))
+
+        return LookaheadPage(results[: self.per_page], number, self, has_next)
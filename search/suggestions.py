@@ -0,0 +1,142 @@
+import bisect
+from collections import namedtuple
+
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from wagtail.models import Page, Site
+from wagtail.search.models import Query
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from core.cache import GenerationCache
+from search.inverted_index import tokenize
+
+
+PageSuggestion = namedtuple(
+    "PageSuggestion", ["page_id", "title", "path", "html_paths"]
+)
+QuerySuggestion = namedtuple("QuerySuggestion", ["query_string", "hits"])
+
+# Prefixes up to this length have their candidates sorted in advance, as
+# they match the most keys
+SHORT_PREFIX_LENGTH = 3
+
+
+class PrefixIndex:
+    """
+    Finds the items with a word that starts with a prefix, best ranked first.
+
+    Every item is stored under each of its word suffixes ("seguros de vida",
+    "de vida" and "vida"), in a sorted array searched with bisect, so a
+    prefix of several words matches them in order. The candidates of short
+    prefixes, which match many keys, are ranked when the index is built.
+    """
+
+    def __init__(self, items, get_text, get_rank):
+        # Items are kept in rank order, so positions sort by rank
+        self.items = sorted(items, key=get_rank)
+
+        entries = []
+        for position, item in enumerate(self.items):
+            words = tokenize(get_text(item))
+            for start in range(len(words)):
+                entries.append((" ".join(words[start:]), position))
+        entries.sort()
+        self.keys = [key for key, position in entries]
+        self.positions = [position for key, position in entries]
+
+        short_prefixes = {}
+        for key, position in entries:
+            for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1):
+                short_prefixes.setdefault(key[:length], set()).add(position)
+        self.short_prefixes = {
+            prefix: sorted(positions) for prefix, positions in short_prefixes.items()
+        }
+
+    def search(self, prefix):
+        """
+        Yields the items that match the prefix, best ranked first.
+        """
+        prefix = " ".join(tokenize(prefix))
+        if not prefix:
+            return
+
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            candidates = self.short_prefixes.get(prefix, ())
+        else:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + "\uffff", start)
+            candidates = sorted(set(self.positions[start:end]))
+
+        for position in candidates:
+            yield self.items[position]
+
+
+def build_page_suggestions():
+    """
+    Returns the prefix index of the titles of the live pages, shortest first,
+    with their path relative to the root of every site that contains them.
+    """
+    roots = {
+        site.id: site.root_page.url_path
+        for site in Site.objects.select_related("root_page")
+    }
+
+    pages = []
+    for page_id, title, path, url_path in Page.objects.live().values_list(
+        "id", "title", "path", "url_path"
+    ):
+        html_paths = {
+            site_id: "/" + url_path[len(root_url_path) :]
+            for site_id, root_url_path in roots.items()
+            if url_path.startswith(root_url_path)
+        }
+        if html_paths:
+            pages.append(PageSuggestion(page_id, title, path, html_paths))
+
+    return PrefixIndex(
+        pages,
+        lambda page: page.title,
+        lambda page: (len(page.title), page.title.lower(), page.page_id),
+    )
+
+
+def build_query_suggestions():
+    """
+    Returns the prefix index of the searched queries, most searched first.
+    """
+    queries = [
+        QuerySuggestion(query_string, hits)
+        for query_string, hits in Query.objects.annotate(
+            total_hits=Sum("daily_hits__hits")
+        )
+        .filter(total_hits__gt=0)
+        .values_list("query_string", "total_hits")
+    ]
+    return PrefixIndex(
+        queries,
+        lambda query: query.query_string,
+        lambda query: (-query.hits, query.query_string),
+    )
+
+
+page_suggestions = GenerationCache("page_suggestions", build_page_suggestions)
+
+# Invalidated whenever buffered search hits are saved
+query_suggestions = GenerationCache("query_suggestions", build_query_suggestions)
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_page_suggestions(sender, **kwargs):
+    page_suggestions.invalidate()
+
+
+@receiver(post_delete)
+def invalidate_page_suggestions_on_delete(sender, instance, **kwargs):
+    if isinstance(instance, Page) and instance.live:
+        page_suggestions.invalidate()
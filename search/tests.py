@@ -0,0 +1,313 @@
+import datetime
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from wagtail.models import Page, PageViewRestriction, Site
+from wagtail.search.backends import get_search_backend
+from wagtail.search.models import Query
+
+from core.jobs import Worker
+from core.models import Job
+from search import backends
+from search.backends import PageIndex
+from search.hits import HitBuffer
+from search.inverted_index import InvertedIndex, tokenize
+from search.paginators import LookaheadPaginator
+
+
+# Tests run in a single process, which doesn't need the shared cache, and the
+# database cache would add its queries to the counted ones
+LOCAL_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class HitBufferTests(TestCase):
+    def setUp(self):
+        self.buffer = HitBuffer()
+        # Flush only when the tests ask to
+        patcher = mock.patch.object(HitBuffer, "_start")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hits_are_saved_in_batches(self):
+        today = datetime.date(2023, 5, 8)
+        for query_string in ["Seguros", "seguros ", "SEGUROS", "Vida"]:
+            self.buffer.add(query_string, today)
+        self.buffer.add("vida", today - datetime.timedelta(1))
+
+        with self.assertNumQueries(0):
+            self.buffer.add("Vida", today)
+        self.assertEqual(Query.objects.count(), 0)
+
+        self.buffer.flush()
+        self.buffer.add("seguros", today)
+        self.buffer.flush()
+
+        self.assertEqual(Query.get("seguros").hits, 4)
+        self.assertEqual(Query.get("vida").hits, 3)
+        self.assertEqual(Query.get("vida").daily_hits.get(date=today).hits, 2)
+
+        with self.assertNumQueries(0):
+            self.buffer.flush()
+
+    def test_failed_hits_stay_pending(self):
+        self.buffer.add("seguros")
+        with mock.patch("search.hits.save_hits", side_effect=Exception):
+            with self.assertLogs("search.hits", "ERROR"):
+                self.buffer.flush()
+
+        self.buffer.flush()
+        self.assertEqual(Query.get("seguros").hits, 1)
+
+
+class InvertedIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = InvertedIndex.build(
+            {
+                1: {"seguros": 2.0, "de": 1.0, "vida": 1.0},
+                2: {"seguros": 1.0, "generales": 1.0},
+                3: {"contacto": 2.0},
+            },
+            "generacion",
+        )
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("Sección: Pólizas, AÑO 2023"), ["seccion", "polizas", "ano", "2023"]
+        )
+
+    def test_score_term(self):
+        scores = self.index.score_term("seguros")
+        self.assertEqual(set(scores), {0, 1})
+        self.assertEqual(self.index.score_term("hogar"), {})
+        self.assertEqual(self.index.get_prefix_terms("ge"), ["generales"])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index")
+            self.index.save(path)
+            loaded = InvertedIndex.load(path)
+
+            self.assertEqual(loaded.generation, "generacion")
+            self.assertEqual(loaded.get_documents(), self.index.get_documents())
+            self.assertEqual(loaded.score_term("vida"), self.index.score_term("vida"))
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class InvertedIndexSearchBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(
+            SEARCH_INDEX_PATH=os.path.join(directory.name, "index")
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.root_page = Site.objects.get(is_default_site=True).root_page
+        self.life_page = self.add_page("Seguros de vida")
+        self.general_page = self.add_page("Seguros generales")
+        self.draft_page = self.add_page("Seguros de borrador", live=False)
+
+    def add_page(self, title, live=True):
+        page = self.root_page.add_child(instance=Page(title=title, live=live))
+        Worker().run_pending()
+        return page
+
+    def search(self, query_string, **kwargs):
+        return [
+            page.title
+            for page in get_search_backend().search(
+                query_string, Page.objects.live(), **kwargs
+            )
+        ]
+
+    def test_search(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.search("seguros de VIDA"), ["Seguros de vida"])
+        self.assertEqual(
+            # The shorter title ranks first
+            self.search("vida generales", operator="or"),
+            ["Seguros generales", "Seguros de vida"],
+        )
+        self.assertEqual(self.search("seguros borrador"), [])
+        self.assertEqual(
+            [
+                page.title
+                for page in get_search_backend().autocomplete(
+                    "seguros gen", Page.objects.live()
+                )
+            ],
+            ["Seguros generales"],
+        )
+
+    def test_index_follows_publishing(self):
+        self.general_page.title = "Seguros de hogar"
+        self.general_page.save_revision().publish()
+        self.draft_page.save_revision().publish()
+        self.life_page.unpublish()
+        with mock.patch.object(
+            InvertedIndex, "build", wraps=InvertedIndex.build
+        ) as build:
+            # One index update for all the pages, and the snapshots of the
+            # children
+            self.assertEqual(Worker().run_pending(), 2)
+        build.assert_called_once()
+
+        self.assertEqual(
+            self.search("seguros"), ["Seguros de hogar", "Seguros de borrador"]
+        )
+        self.assertEqual(self.search("vida"), [])
+
+    def test_count(self):
+        results = get_search_backend().search("seguros", Page.objects.live())
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(results[1:].count(), 1)
+        self.assertEqual(results[:1].count(), 1)
+        self.assertEqual(results[5:].count(), 0)
+
+        results = get_search_backend().search(
+            "seguros", Page.objects.live().order_by("title"), order_by_relevance=False
+        )
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(results[1:].count(), 1)
+        self.assertEqual(results[:1].count(), 1)
+        self.assertEqual(results[5:].count(), 0)
+
+    def test_lost_generation_is_taken_from_the_file(self):
+        cache.delete(PageIndex.cache_key)
+
+        with mock.patch.object(PageIndex, "_save") as save:
+            self.assertEqual(self.search("vida"), ["Seguros de vida"])
+        save.assert_not_called()
+        self.assertIsNotNone(cache.get(PageIndex.cache_key))
+        self.assertFalse(Job.objects.exists())
+
+    def test_missing_index_is_rebuilt_by_a_job(self):
+        os.remove(settings.SEARCH_INDEX_PATH)
+        # Another process, which hasn't loaded the index yet
+        with mock.patch.object(backends, "page_index", PageIndex()):
+            with mock.patch.object(PageIndex, "_save") as save:
+                # Meanwhile, searches use the fallback backend
+                self.assertEqual(self.search("vida"), ["Seguros de vida"])
+            save.assert_not_called()
+
+            self.assertEqual(Worker().run_pending(), 1)
+            self.assertTrue(os.path.exists(settings.SEARCH_INDEX_PATH))
+            with self.assertNumQueries(2):
+                self.assertEqual(self.search("vida"), ["Seguros de vida"])
+
+    def test_other_searches_use_the_fallback(self):
+        self.assertEqual(
+            [page.title for page in get_search_backend().search("borrador", Page)],
+            ["Seguros de borrador"],
+        )
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class LookaheadPaginatorTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.results = mock.MagicMock(wraps=list(range(25)))
+        self.results.__getitem__.side_effect = list(range(25)).__getitem__
+
+    def test_pages(self):
+        paginator = LookaheadPaginator(self.results, 10, "count")
+        self.assertIsNone(paginator.count)
+
+        page = paginator.page("2")
+        self.assertEqual(list(page), list(range(10, 20)))
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+        self.results.__getitem__.assert_called_once_with(slice(10, 21))
+        self.assertIsNone(paginator.count)
+
+        page = paginator.page("nope")
+        self.assertEqual(page.number, 1)
+
+        page = paginator.page(3)
+        self.assertEqual(list(page), list(range(20, 25)))
+        self.assertFalse(page.has_next())
+        self.assertEqual(paginator.count, 25)
+        self.assertEqual(paginator.num_pages, 3)
+
+    def test_page_past_the_end(self):
+        paginator = LookaheadPaginator(self.results, 10, "count")
+        page = paginator.page(7)
+        self.assertEqual(list(page), [])
+        self.assertIsNone(paginator.count)
+
+        # Once the count is known, it's the last page
+        paginator.page(3)
+        self.assertEqual(paginator.page(7).number, 3)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class SuggestionsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        root_page = Site.objects.get(is_default_site=True).root_page
+        for title in ["Seguros de vida", "Seguros generales", "Contacto", "Vida"]:
+            root_page.add_child(instance=Page(title=title))
+        private_page = root_page.add_child(instance=Page(title="Seguros internos"))
+        PageViewRestriction.objects.create(
+            page=private_page, restriction_type=PageViewRestriction.LOGIN
+        )
+        root_page.add_child(instance=Page(title="Seguros en borrador", live=False))
+
+        buffer = HitBuffer()
+        with mock.patch.object(HitBuffer, "_start"):
+            for query_string in ["seguros", "seguros", "segunda", "vida"]:
+                buffer.add(query_string)
+        buffer.flush()
+
+        # Warm up the suggestion indexes
+        self.client.get("/search/suggestions/?query=s")
+
+    def get_suggestions(self, query_string, **params):
+        response = self.client.get(
+            "/search/suggestions/", {"query": query_string, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_suggestions(self):
+        with self.assertNumQueries(0):
+            suggestions = self.get_suggestions("se")
+
+        self.assertEqual(
+            [page["title"] for page in suggestions["pages"]],
+            ["Seguros de vida", "Seguros generales"],
+        )
+        self.assertEqual(
+            suggestions["queries"],
+            [{"query": "seguros", "hits": 2}, {"query": "segunda", "hits": 1}],
+        )
+
+        suggestions = self.get_suggestions("VID", limit=1)
+        vida = Page.objects.get(title="Vida")
+        self.assertEqual(
+            suggestions["pages"], [{"id": vida.id, "title": "Vida", "url": "/vida/"}]
+        )
+        self.assertEqual(suggestions["queries"], [{"query": "vida", "hits": 1}])
+
+        self.assertEqual(
+            [page["title"] for page in self.get_suggestions("seguros ge")["pages"]],
+            ["Seguros generales"],
+        )
+        self.assertEqual(self.get_suggestions(""), {"pages": [], "queries": []})
+
+    def test_suggestions_follow_publishing(self):
+        page = Page.objects.get(title="Seguros en borrador")
+        page.save_revision().publish()
+
+        self.assertIn(
+            "Seguros en borrador",
+            [page["title"] for page in self.get_suggestions("seg")["pages"]],
+        )
@@ -1,8 +1,20 @@
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from itertools import islice
+
+from django.http import JsonResponse
 from django.template.response import TemplateResponse
 
 from wagtail.models import Page
-from wagtail.search.models import Query
+from wagtail.search.utils import normalise_query_string
+
+from core.restrictions import get_restricted_paths
+from core.sites import find_site_for_request
+from search.hits import hit_buffer
+from search.paginators import LookaheadPaginator, get_count_cache_key
+from search.suggestions import page_suggestions, query_suggestions
+
+
+SUGGESTIONS_LIMIT = 5
+SUGGESTIONS_LIMIT_MAX = 10
 
 
 def search(request):
@@ -12,21 +24,18 @@ def search(request):
     # Search
     if search_query:
         search_results = Page.objects.live().search(search_query)
-        query = Query.get(search_query)
 
-        # Record hit
-        query.add_hit()
+        # Record hit, saved later with the other pending ones
+        hit_buffer.add(search_query)
     else:
         search_results = Page.objects.none()
 
     # Pagination
-    paginator = Paginator(search_results, 10)
-    try:
-        search_results = paginator.page(page)
-    except PageNotAnInteger:
-        search_results = paginator.page(1)
-    except EmptyPage:
-        search_results = paginator.page(paginator.num_pages)
+    count_key = None
+    if search_query:
+        count_key = get_count_cache_key(normalise_query_string(search_query))
+    paginator = LookaheadPaginator(search_results, 10, count_key)
+    search_results = paginator.page(page)
 
     return TemplateResponse(
         request,
@@ -36,3 +45,41 @@ def search(request):
             "search_results": search_results,
         },
     )
+
+
+def suggestions(request):
+    """
+    Returns the live page titles and the searched queries that contain a word
+    starting with the query, for type-ahead boxes.
+    """
+    prefix = request.GET.get("query", "")
+    try:
+        limit = int(request.GET.get("limit", SUGGESTIONS_LIMIT))
+    except ValueError:
+        limit = SUGGESTIONS_LIMIT
+    limit = min(max(limit, 1), SUGGESTIONS_LIMIT_MAX)
+
+    pages = []
+    site = find_site_for_request(request)
+    if site is not None:
+        restricted_paths = get_restricted_paths(request)
+        for page in page_suggestions.get().search(prefix):
+            if site.id in page.html_paths and not page.path.startswith(
+                restricted_paths
+            ):
+                pages.append(
+                    {
+                        "id": page.page_id,
+                        "title": page.title,
+                        "url": page.html_paths[site.id],
+                    }
+                )
+                if len(pages) == limit:
+                    break
+
+    queries = [
+        {"query": query.query_string, "hits": query.hits}
+        for query in islice(query_suggestions.get().search(prefix), limit)
+    ]
+
+    return JsonResponse({"pages": pages, "queries": queries})